@@ -0,0 +1,135 @@
+import os
+import time
+from typing import Iterable, Iterator, Dict, Any, Union, List, Tuple
+
+from puzzlefile import puzzle_from_dict, puzzle_to_dict, PuzzleFormatError
+from solver import Nonogram, Contradiction, SearchLimitExceeded
+
+
+VECTORIZED_BATCH_SIZE = 64
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, Contradiction):
+        return str(error)
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def _read_record(data: Union[Dict[str, Any], PuzzleFormatError], compact: bool) -> Nonogram:
+    if isinstance(data, PuzzleFormatError):
+        raise data
+    return puzzle_from_dict(data, compact)
+
+
+def _failed_record(data: Union[Dict[str, Any], PuzzleFormatError], name: Any, error: Exception) -> Dict[str, Any]:
+    # Used when not even the puzzle could be built from the record
+    return {'id': data.get('id', name) if isinstance(data, dict) else name, 'solved': False, 'time': 0.0, 'error': _describe(error)}
+
+
+def _finish_record(data: Dict[str, Any], name: Any, puzzle: Nonogram, solved: bool, error: Union[str, None], elapsed: float, max_nodes: int, time_limit: float, count_limit: int) -> Dict[str, Any]:
+    record = {'id': data.get('id', name), 'solved': solved, 'time': elapsed}
+    record.update(puzzle_to_dict(puzzle))
+    if error:
+        record['error'] = error
+    if count_limit > 0:
+        try:
+            record['solutions'] = puzzle_from_dict(data, True).count_solutions(count_limit, max_nodes, time_limit)
+        except SearchLimitExceeded:
+            record['solutions'] = None
+        except Exception as e:
+            record['solutions'] = None
+            record.setdefault('error', _describe(e))
+    return record
+
+
+def solve_record(data: Dict[str, Any], name: Any, engine: str = 'classic', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, count_limit: int = 0) -> Dict[str, Any]:
+    # A broken record must not stop the rest of the batch, or the worker it runs in
+    try:
+        puzzle = _read_record(data, engine != 'classic')
+    except Exception as e:
+        return _failed_record(data, name, e)
+    error = None
+    start = time.perf_counter()
+    try:
+        solved = puzzle.solve(engine, search, max_nodes, time_limit)
+    except Exception as e:
+        solved = False
+        error = _describe(e)
+    elapsed = time.perf_counter() - start
+    return _finish_record(data, name, puzzle, solved, error, elapsed, max_nodes, time_limit, count_limit)
+
+
+def solve_records(chunk: List[Tuple[Any, Dict[str, Any]]], engine: str = 'classic', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, count_limit: int = 0) -> List[Dict[str, Any]]:
+    if engine != 'numpy':
+        return [solve_record(data, name, engine, search, max_nodes, time_limit, count_limit) for name, data in chunk]
+    from vectorized import solve_puzzles
+    # The line logic runs on all boards of the chunk at once, each puzzle is charged an equal share of it
+    start = time.perf_counter()
+    records = [None] * len(chunk)
+    valid = []
+    for i, (name, data) in enumerate(chunk):
+        try:
+            valid.append((i, _read_record(data, True)))
+        except Exception as e:
+            records[i] = _failed_record(data, name, e)
+    if not valid:
+        return records
+    try:
+        consistent = solve_puzzles([puzzle for _, puzzle in valid])
+    except Exception:
+        # Solving the boards one by one finds the one that broke the batch
+        for i, _ in valid:
+            name, data = chunk[i]
+            records[i] = solve_record(data, name, engine, search, max_nodes, time_limit, count_limit)
+        return records
+    shared = (time.perf_counter() - start) / len(valid)
+    for (i, puzzle), ok in zip(valid, consistent):
+        name, data = chunk[i]
+        error = None
+        start = time.perf_counter()
+        try:
+            if not ok:
+                raise Contradiction('Puzzle has no solution')
+            solved = puzzle.resume(search, max_nodes, time_limit)
+        except Exception as e:
+            solved = False
+            error = _describe(e)
+        elapsed = shared + time.perf_counter() - start
+        records[i] = _finish_record(data, name, puzzle, solved, error, elapsed, max_nodes, time_limit, count_limit)
+    return records
+
+
+def solve_many(puzzles: Iterable[Dict[str, Any]], workers: Union[int, None] = None, engine: str = 'classic', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, count_limit: int = 0) -> Iterator[Dict[str, Any]]:
+    # Puzzles are passed as plain clue/grid dicts, which are much cheaper to pickle than a Nonogram
+    workers = workers or os.cpu_count() or 1
+    chunk_size = VECTORIZED_BATCH_SIZE if engine == 'numpy' else 1
+    chunks = _chunks(enumerate(puzzles), chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from solve_records(chunk, engine, search, max_nodes, time_limit, count_limit)
+        return
+    # Starting processes needs multiprocessing, which is slow to import and not needed for a single worker
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(solve_records, chunk, engine, search, max_nodes, time_limit, count_limit))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def _chunks(items: Iterable[Tuple[int, Dict[str, Any]]], size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import List, Dict, Any
+
+from generator import generate_puzzle, generate_unique_puzzle
+from puzzlefile import puzzle_from_dict
+from solver import ENGINES, Nonogram, Contradiction, CellState, SolveTrace, line_cache
+
+STARTUP_MODULES = ['main', 'batch']
+HEAVY_MODULES = ['numpy', 'PIL', 'pytesseract']
+UNIQUE_ATTEMPTS = 20
+UNIQUE_MAX_NODES = 20000
+UNIQUE_TIME_LIMIT = 2.0
+
+
+def measure_startup(module: str, runs: int) -> Dict[str, Any]:
+    # Every run is a new interpreter, so nothing is imported yet
+    code = 'import sys, time; start = time.perf_counter(); import {}; print(time.perf_counter() - start); print(*[m for m in {!r} if m in sys.modules])'.format(module, HEAVY_MODULES)
+    times = []
+    for _ in range(runs):
+        res = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, check=True)
+        lines = res.stdout.decode('utf-8').split('\n')
+        times.append(float(lines[0]))
+    return {'module': module, 'import_time': min(times), 'heavy_modules': lines[1].split()}
+
+
+def solve_timed(puzzle: Nonogram, engine: str, search: bool, with_passes: bool) -> Dict[str, Any]:
+    trace = SolveTrace() if with_passes else None
+    start = time.perf_counter()
+    try:
+        solved = puzzle.solve(engine, search, trace=trace)
+    except Contradiction:
+        solved = False
+    elapsed = time.perf_counter() - start
+    known = sum(1 for row in puzzle.puzzle for cell in row if cell.cell.state != CellState.FREE)
+    passes = {name: total.time for name, total in trace.totals().items()} if trace else {}
+    return {'solved': solved, 'time': elapsed, 'known': known, 'passes': passes}
+
+
+def generate_puzzles(size: int, density: float, count: int, rng: random.Random, unique: bool) -> List[Dict[str, Any]]:
+    if not unique:
+        return [generate_puzzle(size, size, density, rng) for _ in range(count)]
+    # Puzzles with several solutions can not be solved by any engine, which would make the solve rate mostly a measure of the generator
+    puzzles = [generate_unique_puzzle(size, size, density, rng, UNIQUE_ATTEMPTS, UNIQUE_MAX_NODES, UNIQUE_TIME_LIMIT) for _ in range(count)]
+    return [data for data in puzzles if data is not None]
+
+
+def run_benchmark(sizes: List[int], density: float, count: int, seed: int, engines: List[str], search: bool, unique: bool = False) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        rng = random.Random('{}-{}'.format(seed, size))
+        puzzles = generate_puzzles(size, density, count, rng, unique)
+        if not puzzles:
+            continue
+        for engine in engines:
+            total_time = 0.0
+            known = 0
+            solved = 0
+            passes = {}
+            line_cache.clear()
+            for data in puzzles:
+                result = solve_timed(puzzle_from_dict(data), engine, search, False)
+                total_time += result['time']
+                known += result['known']
+                solved += result['solved']
+            cache_stats = line_cache.stats()
+            # Pass timings and memory are measured in separate runs, so they do not distort the end to end time
+            for data in puzzles:
+                for name, elapsed in solve_timed(puzzle_from_dict(data), engine, search, True)['passes'].items():
+                    passes[name] = passes.get(name, 0.0) + elapsed
+            tracemalloc.start()
+            for data in puzzles:
+                solve_timed(puzzle_from_dict(data), engine, search, False)
+            memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({
+                'size': size,
+                'engine': engine,
+                'search': search,
+                'unique': unique,
+                'puzzles': len(puzzles),
+                'time': total_time,
+                'time_per_puzzle': total_time / len(puzzles),
+                'cells_per_second': known / total_time if total_time else 0.0,
+                'solve_rate': solved / len(puzzles),
+                'memory_peak': memory_peak,
+                'passes': passes,
+                'line_cache': cache_stats,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Nonogram solver on random puzzles')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20, 30, 50], help='side lengths of the generated puzzles')
+    parser.add_argument('--density', type=float, default=0.55, help='probability that a cell is marked')
+    parser.add_argument('--count', type=int, default=10, help='number of puzzles per size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engines', choices=ENGINES, nargs='+', default=ENGINES)
+    parser.add_argument('--search', action='store_true', help='guess cells when line logic gets stuck')
+    parser.add_argument('--unique', action='store_true', help='only use puzzles with a single solution, so solve rates compare the engines')
+    parser.add_argument('--startup-runs', type=int, default=5, help='number of interpreters to start when timing the imports (0 to skip)')
+    parser.add_argument('--output', '-o', default='-', help='file to write the JSON results to (default: stdout)')
+    args = parser.parse_args()
+    results = {
+        'config': {'sizes': args.sizes, 'density': args.density, 'count': args.count, 'seed': args.seed, 'unique': args.unique},
+        'results': run_benchmark(args.sizes, args.density, args.count, args.seed, args.engines, args.search, args.unique),
+    }
+    if args.startup_runs > 0:
+        results['startup'] = [measure_startup(module, args.startup_runs) for module in STARTUP_MODULES]
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
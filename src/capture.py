@@ -0,0 +1,54 @@
+import io
+import subprocess
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image
+
+
+def image_to_array(image: Image) -> np.ndarray:
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+
+class ScreenCapture(ABC):
+
+    interactive: bool = True
+
+    @abstractmethod
+    def capture(self, wid: str) -> np.ndarray:
+        pass
+
+
+class ImportCapture(ScreenCapture):
+
+    def capture(self, wid: str) -> np.ndarray:
+        # PPM is uncompressed, so nothing has to be encoded or written to disk
+        res = subprocess.run(['import', '-silent', '-window', wid, 'ppm:-'], stdout=subprocess.PIPE, check=True)
+        return image_to_array(Image.open(io.BytesIO(res.stdout)))
+
+
+class FileCapture(ScreenCapture):
+
+    interactive = False
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def capture(self, wid: str) -> np.ndarray:
+        with Image.open(self.path) as image:
+            return image_to_array(image)
+
+
+class ArrayCapture(ScreenCapture):
+
+    interactive = False
+    pixels: np.ndarray
+
+    def __init__(self, pixels: np.ndarray):
+        self.pixels = pixels
+
+    def capture(self, wid: str) -> np.ndarray:
+        return self.pixels
@@ -0,0 +1,214 @@
+from array import array
+from typing import Tuple, Iterator, Union
+
+from solver import Nonogram, CellState, SolveTrace
+
+FREE = CellState.FREE.value
+MARKED = CellState.MARKED.value
+BLOCKED = CellState.BLOCKED.value
+STATES = {state.value: state for state in CellState}
+
+
+class CellView:
+
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid: 'CompactNonogram', index: int):
+        self.grid = grid
+        self.index = index
+
+    @property
+    def cell(self) -> 'CellView':
+        # Stands in for both RowCell and Cell, so puzzle[y][x].cell.state keeps working
+        return self
+
+    @property
+    def state(self) -> CellState:
+        return STATES[self.grid.states[self.index]]
+
+    @state.setter
+    def state(self, state: CellState) -> None:
+        self.grid.states[self.index] = state.value
+
+    @property
+    def initial_state(self) -> CellState:
+        return STATES[self.grid.initial_states[self.index]]
+
+    @initial_state.setter
+    def initial_state(self, state: CellState) -> None:
+        self.grid.initial_states[self.index] = state.value
+
+
+class LineView:
+
+    __slots__ = ('grid', 'start', 'step', 'length')
+
+    def __init__(self, grid: 'CompactNonogram', start: int, step: int, length: int):
+        self.grid = grid
+        self.start = start
+        self.step = step
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, i: int) -> CellView:
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+        return CellView(self.grid, self.start + i * self.step)
+
+    def __iter__(self) -> Iterator[CellView]:
+        for i in range(self.length):
+            yield CellView(self.grid, self.start + i * self.step)
+
+
+class GridView:
+
+    __slots__ = ('grid', 'flipped')
+
+    def __init__(self, grid: 'CompactNonogram', flipped: bool):
+        self.grid = grid
+        self.flipped = flipped
+
+    def __len__(self) -> int:
+        return self.grid.width if self.flipped else self.grid.height
+
+    def __getitem__(self, i: int) -> LineView:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self.flipped:
+            return LineView(self.grid, i, self.grid.width, self.grid.height)
+        return LineView(self.grid, i * self.grid.width, 1, self.grid.width)
+
+    def __iter__(self) -> Iterator[LineView]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class HintView:
+
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid: 'CompactNonogram', index: int):
+        self.grid = grid
+        self.index = index
+
+    @property
+    def value(self) -> int:
+        return self.grid.hint_values[self.index]
+
+    @property
+    def leftmost(self) -> int:
+        return self.grid.hint_leftmost[self.index]
+
+    @leftmost.setter
+    def leftmost(self, value: int) -> None:
+        self.grid.hint_leftmost[self.index] = value
+
+    @property
+    def rightmost(self) -> int:
+        return self.grid.hint_rightmost[self.index]
+
+    @rightmost.setter
+    def rightmost(self, value: int) -> None:
+        self.grid.hint_rightmost[self.index] = value
+
+    def __repr__(self):
+        return 'Hint <{} ({}-{})>'.format(self.value, self.leftmost, self.rightmost)
+
+
+class CompactNonogram(Nonogram):
+
+    states: bytearray
+    initial_states: bytearray
+    hint_values: array
+    hint_leftmost: array
+    hint_rightmost: array
+
+    def __init__(self, width: int, height: int):
+        # Deliberately does not call Nonogram.__init__, which builds the Cell and RowCell objects
+        self.width = width
+        self.height = height
+        self.states = bytearray([FREE]) * (width * height)
+        self.initial_states = bytearray([FREE]) * (width * height)
+        self.puzzle = GridView(self, False)
+        self.puzzle_flipped = GridView(self, True)
+        self.hint_values = array('i')
+        self.hint_leftmost = array('i')
+        self.hint_rightmost = array('i')
+        self.horizontal = [[] for _ in range(height)]
+        self.vertical = [[] for _ in range(width)]
+        self._init_state()
+
+    def row(self, y: int) -> memoryview:
+        return memoryview(self.states)[y * self.width:(y + 1) * self.width]
+
+    def column(self, x: int) -> memoryview:
+        return memoryview(self.states)[x::self.width]
+
+    def _add_hint(self, value: int) -> HintView:
+        self.hint_values.append(value)
+        self.hint_leftmost.append(0)
+        self.hint_rightmost.append(0)
+        return HintView(self, len(self.hint_values) - 1)
+
+    def add_horizontal_hint(self, y: int, value: int) -> None:
+        self.horizontal[y].append(self._add_hint(value))
+
+    def add_vertical_hint(self, x: int, value: int) -> None:
+        self.vertical[x].append(self._add_hint(value))
+
+    def _init_solve(self) -> None:
+        self.states[:] = self.initial_states
+        for size, hint_lists in ((self.width, self.horizontal), (self.height, self.vertical)):
+            for hint_list in hint_lists:
+                for hint in hint_list:
+                    self.hint_leftmost[hint.index] = 0
+                    self.hint_rightmost[hint.index] = size - self.hint_values[hint.index]
+
+    def _init_masks(self) -> None:
+        self.marked_rows = [0] * self.height
+        self.blocked_rows = [0] * self.height
+        self.marked_cols = [0] * self.width
+        self.blocked_cols = [0] * self.width
+        for y in range(self.height):
+            row = self.row(y)
+            for x in range(self.width):
+                if row[x] == MARKED:
+                    self.marked_rows[y] |= 1 << x
+                    self.marked_cols[x] |= 1 << y
+                elif row[x] == BLOCKED:
+                    self.blocked_rows[y] |= 1 << x
+                    self.blocked_cols[x] |= 1 << y
+
+    def _set_cell_state(self, x: int, y: int, state: CellState) -> None:
+        self.states[y * self.width + x] = state.value
+        if state == CellState.MARKED:
+            self.marked_rows[y] |= 1 << x
+            self.marked_cols[x] |= 1 << y
+        else:
+            self.blocked_rows[y] |= 1 << x
+            self.blocked_cols[x] |= 1 << y
+        self._add_solve_order(x, y)
+
+    def _free_cell(self, x: int, y: int) -> None:
+        self.states[y * self.width + x] = FREE
+
+    def _save_bounds(self) -> Tuple[array, array]:
+        return self.hint_leftmost[:], self.hint_rightmost[:]
+
+    def _load_bounds(self, bounds: Tuple[array, array]) -> None:
+        self.hint_leftmost[:] = bounds[0]
+        self.hint_rightmost[:] = bounds[1]
+
+    def count_known_cells(self) -> int:
+        return len(self.states) - self.states.count(FREE)
+
+    def solve(self, engine: str = 'bitmask', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, trace: Union[SolveTrace, None] = None) -> bool:
+        if engine == 'classic':
+            raise ValueError('The classic engine needs the Cell and RowCell objects of Nonogram')
+        return super().solve(engine, search, max_nodes, time_limit, trace)
@@ -0,0 +1,47 @@
+import random
+from typing import List, Dict, Any, Union
+
+from puzzlefile import puzzle_from_dict
+from solver import SearchLimitExceeded
+
+
+def random_grid(width: int, height: int, density: float, rng: random.Random) -> List[List[bool]]:
+    return [[rng.random() < density for _ in range(width)] for _ in range(height)]
+
+
+def line_clues(line: List[bool]) -> List[int]:
+    clues = []
+    run = 0
+    for marked in line:
+        if marked:
+            run += 1
+        elif run:
+            clues.append(run)
+            run = 0
+    if run:
+        clues.append(run)
+    return clues
+
+
+def grid_to_puzzle(grid: List[List[bool]]) -> Dict[str, Any]:
+    return {
+        'rows': [line_clues(row) for row in grid],
+        'columns': [line_clues(list(column)) for column in zip(*grid)],
+        'solution': [''.join('#' if marked else 'x' for marked in row) for row in grid],
+    }
+
+
+def generate_puzzle(width: int, height: int, density: float, rng: random.Random) -> Dict[str, Any]:
+    return grid_to_puzzle(random_grid(width, height, density, rng))
+
+
+def generate_unique_puzzle(width: int, height: int, density: float, rng: random.Random, attempts: int = 100, max_nodes: int = 1000000, time_limit: float = 60.0) -> Union[Dict[str, Any], None]:
+    for _ in range(attempts):
+        data = generate_puzzle(width, height, density, rng)
+        try:
+            if puzzle_from_dict(data, True).count_solutions(2, max_nodes, time_limit) == 1:
+                return data
+        except SearchLimitExceeded:
+            # Too hard to tell within the budget, another one is usually quicker
+            pass
+    return None
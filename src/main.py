@@ -1,37 +1,98 @@
 #!/usr/bin/env python3
 
 import argparse
+import sys
+from typing import Any
 
-from printer import print_puzzle, print_puzzle_debug
-from puzzlemanager import PuzzleManager
+from batch import solve_many
+from printer import print_puzzle, print_puzzle_debug, print_trace
+from puzzlefile import read_puzzles, write_record
+from solver import ENGINES, SolveTrace
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Solve Nonograms')
-    parser.add_argument('--window-name', default='Nonograms - online puzzle game - Chromium')
-    parser.add_argument('--skip-crosses', '-c', action='store_true', help='do not add crosses in the solution')
-    parser.add_argument('--solve-order', '-s', action='store_true', help='apply the solution in the order in which it was found')
-    parser.add_argument('--print-read', '-r', action='store_true', help='print the puzzle before solving')
-    parser.add_argument('--print', '-p', action='store_true', help='print the solved puzzle')
-    parser.add_argument('--print-debug', '-d', action='store_true', help='print debug information')
-    args = parser.parse_args()
+def solve_live(args: argparse.Namespace) -> None:
+    # Imported here, so that solving from files does not load NumPy, PIL and Tesseract
+    from puzzlemanager import PuzzleManager
     manager = PuzzleManager(args.window_name)
-    manager.read_puzzle()
+    manager.read_puzzle(args.workers)
     if args.print_read:
         print_puzzle(manager.puzzle)
+    trace = SolveTrace() if args.print_debug else None
     try:
-        manager.puzzle.solve()
+        if args.stream:
+            solved = manager.solve_and_apply(not args.skip_crosses, args.batch_clicks, args.click_delay, args.engine, args.search, args.max_nodes, args.time_limit, trace)
+        else:
+            solved = manager.puzzle.solve(args.engine, args.search, args.max_nodes, args.time_limit, trace)
+        if solved:
+            print('Solved completely!')
         if args.print:
             print_puzzle(manager.puzzle)
         if args.print_debug:
             print_puzzle_debug(manager.puzzle)
-        if args.solve_order:
-            manager.apply_puzzle_in_solve_order(not args.skip_crosses)
+            print_trace(trace)
+        if args.stream:
+            return
+        if args.drag:
+            manager.apply_puzzle_with_strokes(not args.skip_crosses, args.batch_clicks or 0, args.click_delay)
+        elif args.solve_order:
+            manager.apply_puzzle_in_solve_order(not args.skip_crosses, args.batch_clicks, args.click_delay, args.by_step, args.step_delay)
         else:
-            manager.apply_puzzle(not args.skip_crosses)
+            manager.apply_puzzle(not args.skip_crosses, args.batch_clicks, args.click_delay)
     finally:
         manager.move_mouse(manager.puzzle_box[0], manager.puzzle_box[1])
 
 
+def solve_batch(args: argparse.Namespace) -> None:
+    source = sys.stdin if args.input == '-' else open(args.input)
+    target = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for record in solve_many(read_puzzles(source), args.jobs, args.engine, args.search, args.max_nodes, args.time_limit, args.count_solutions):
+            write_record(target, record)
+            print('{}: {} in {:.1f} ms'.format(record['id'], 'solved' if record['solved'] else 'not solved', record['time'] * 1000), file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+def add_solver_arguments(parser: argparse.ArgumentParser, default: Any = None) -> None:
+    parser.add_argument('--engine', '-e', choices=ENGINES, default=default or 'classic', help='solver engine to use')
+    parser.add_argument('--search', action='store_true', default=default or False, help='guess cells when line logic gets stuck')
+    parser.add_argument('--max-nodes', type=int, default=default or 100000, help='maximum number of guesses when searching')
+    parser.add_argument('--time-limit', type=float, default=default or 10.0, help='maximum number of seconds to spend searching')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve Nonograms')
+    parser.add_argument('--window-name', default='Nonograms - online puzzle game - Chromium')
+    parser.add_argument('--skip-crosses', '-c', action='store_true', help='do not add crosses in the solution')
+    parser.add_argument('--solve-order', '-s', action='store_true', help='apply the solution in the order in which it was found')
+    parser.add_argument('--by-step', action='store_true', help='with --solve-order, enter the cells found by each solver step together')
+    parser.add_argument('--step-delay', type=float, default=0.0, help='seconds to wait between solver steps with --by-step')
+    parser.add_argument('--stream', action='store_true', help='enter cells while the solver is still running')
+    parser.add_argument('--print-read', '-r', action='store_true', help='print the puzzle before solving')
+    parser.add_argument('--print', '-p', action='store_true', help='print the solved puzzle')
+    parser.add_argument('--print-debug', '-d', action='store_true', help='print debug information')
+    add_solver_arguments(parser)
+    parser.add_argument('--workers', '-w', type=int, default=1, help='number of processes used to read the hints')
+    parser.add_argument('--drag', '-g', action='store_true', help='fill runs of cells with a single mouse drag')
+    parser.add_argument('--batch-clicks', '-b', type=int, metavar='N', help='send clicks to a single xdotool process, N clicks at a time (0 for all at once)')
+    parser.add_argument('--click-delay', type=float, default=0.0, help='seconds to wait between batched clicks')
+    subparsers = parser.add_subparsers(dest='command')
+    batch_parser = subparsers.add_parser('batch', help='solve puzzles from a JSON lines file instead of the browser')
+    batch_parser.add_argument('input', nargs='?', default='-', help='file with one puzzle per line (default: stdin)')
+    batch_parser.add_argument('--output', '-o', default='-', help='file to write the solutions to (default: stdout)')
+    batch_parser.add_argument('--count-solutions', type=int, default=0, metavar='K', help='also count the solutions of each puzzle, stopping at K')
+    batch_parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes to solve puzzles with (0 for one per CPU)')
+    # Also accepted after the subcommand, without resetting options given in front of it
+    add_solver_arguments(batch_parser, argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.command == 'batch':
+        solve_batch(args)
+    else:
+        solve_live(args)
+
+
 if __name__ == '__main__':
     main()
@@ -1,74 +1,81 @@
+import fcntl
+import hashlib
+import json
 import os
 import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Dict, List, Tuple, Any, Callable
+
+import numpy as np
 import pytesseract
 
 from PIL import Image
 
+from capture import image_to_array
+
 ROOT_PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 OCR_PATH = os.path.join(ROOT_PATH, 'ocr')
 DATA_PATH = os.path.join(ROOT_PATH, 'data')
 WHITE = (255, 255, 255)
 EMPTY_CUTOFF = 0.99
+INK_CUTOFF = 128
+BATCH_SPACING = 10
+TEMPLATE_SIZE = (16, 12)
+TEMPLATE_MAX_DISTANCE = 0.03
+TEMPLATE_MIN_MARGIN = 0.05
+TEMPLATE_MAX_ASPECT_DIFFERENCE = 0.15
+HASH_SIZE = 8
+CORRECTION_MAX_DISTANCE = 2
 
 
-def white_ratio(region: Image) -> float:
-    white_pixels = 0
-    for y in range(region.size[1]):
-        for x in range(region.size[0]):
-            if region.getpixel((x, y)) == WHITE:
-                white_pixels += 1
-    return white_pixels / (region.size[0] * region.size[1])
+def _white_mask(region: np.ndarray) -> np.ndarray:
+    return (region == WHITE).all(axis=-1)
 
 
-def is_empty(region: Image) -> bool:
-    return white_ratio(region) >= EMPTY_CUTOFF
+def white_ratio_array(region: np.ndarray) -> float:
+    return _white_mask(region).mean()
 
 
-def cut_off_border(region: Image) -> Image:
-    top = 0
-    bottom = region.size[1]
-    left = 0
-    right = region.size[0]
-    mid_x = right // 2
-    mid_y = bottom // 2
-    while top < bottom and region.getpixel((mid_x, top)) != WHITE:
-        top += 1
-    if top == bottom:
-        return None
-    while region.getpixel((mid_x, bottom - 1)) != WHITE:
-        bottom -= 1
-    while left < right and region.getpixel((left, mid_y)) != WHITE:
-        left += 1
-    if left == right:
+def is_empty_array(region: np.ndarray) -> bool:
+    return white_ratio_array(region) >= EMPTY_CUTOFF
+
+
+def cut_off_border_array(region: np.ndarray) -> Union[np.ndarray, None]:
+    column = _white_mask(region[:, region.shape[1] // 2])
+    row = _white_mask(region[region.shape[0] // 2])
+    if not column.any() or not row.any():
         return None
-    while region.getpixel((right - 1, mid_y)) != WHITE:
-        right -= 1
-    return region.crop((left, top, right, bottom))
-
-
-def crop_content(region: Image) -> Image:
-    top = 0
-    bottom = region.size[1]
-    left = 0
-    right = region.size[0]
-
-    def white_line(x: int, y: int, dx: int, dy: int):
-        while x < region.size[0] and y < region.size[1]:
-            if region.getpixel((x, y)) != WHITE:
-                return False
-            x += dx
-            y += dy
-        return True
-
-    while white_line(0, top, 1, 0):
-        top += 1
-    while white_line(0, bottom - 1, 1, 0):
-        bottom -= 1
-    while white_line(left, 0, 0, 1):
-        left += 1
-    while white_line(right - 1, 0, 0, 1):
-        right -= 1
-    return region.crop((left - 2, top - 2, right + 2, bottom + 2))
+    top = column.argmax()
+    bottom = len(column) - column[::-1].argmax()
+    left = row.argmax()
+    right = len(row) - row[::-1].argmax()
+    return region[top:bottom, left:right]
+
+
+def crop_content_array(region: np.ndarray) -> np.ndarray:
+    content = ~_white_mask(region)
+    rows = np.flatnonzero(content.any(axis=1))
+    cols = np.flatnonzero(content.any(axis=0))
+    top, bottom = rows[0] - 2, rows[-1] + 3
+    left, right = cols[0] - 2, cols[-1] + 3
+    if top >= 0 and left >= 0 and bottom <= region.shape[0] and right <= region.shape[1]:
+        return region[top:bottom, left:right]
+    # Same as Image.crop, which fills the area outside of the image with black
+    padded = np.zeros((bottom - top, right - left, region.shape[2]), dtype=region.dtype)
+    src_top, src_left = max(top, 0), max(left, 0)
+    src_bottom, src_right = min(bottom, region.shape[0]), min(right, region.shape[1])
+    padded[src_top - top:src_bottom - top, src_left - left:src_right - left] = region[src_top:src_bottom, src_left:src_right]
+    return padded
+
+
+def _write_if_changed(path: str, text: str) -> None:
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                return
+    with open(path, 'w') as f:
+        f.write(text)
 
 
 def init_tesseract() -> None:
@@ -81,41 +88,299 @@ def init_tesseract() -> None:
         'load_number_dawg T',
         'user_words_file {}'.format(os.path.join(OCR_PATH, 'eng.user-words')),
     ]
-    with open(os.path.join(OCR_PATH, 'eng.user-words'), 'w') as f:
-        for i in range(1, 100):
-            print(i, file=f)
-    with open(os.path.join(OCR_PATH, 'config'), 'w') as f:
-        for config in configs:
-            print(config, file=f)
+    # The files only change when the configuration above does, so they are usually left alone
+    os.makedirs(OCR_PATH, exist_ok=True)
+    _write_if_changed(os.path.join(OCR_PATH, 'eng.user-words'), ''.join('{}\n'.format(i) for i in range(1, 100)))
+    _write_if_changed(os.path.join(OCR_PATH, 'config'), ''.join('{}\n'.format(config) for config in configs))
+
+
+def glyph_bitmap(region: np.ndarray) -> np.ndarray:
+    return region.min(axis=-1) < INK_CUTOFF
+
+
+def glyph_key(bitmap: np.ndarray) -> str:
+    data = '{}x{}:'.format(*bitmap.shape).encode() + np.packbits(bitmap).tobytes()
+    return hashlib.sha1(data).hexdigest()
+
+
+def normalize_glyph(bitmap: np.ndarray) -> np.ndarray:
+    rows = np.arange(TEMPLATE_SIZE[0]) * bitmap.shape[0] // TEMPLATE_SIZE[0]
+    cols = np.arange(TEMPLATE_SIZE[1]) * bitmap.shape[1] // TEMPLATE_SIZE[1]
+    return bitmap[rows[:, None], cols]
+
+
+# JSON lines file that several processes append to and read from, each keeping its own offset
+class SharedLog(ABC):
+
+    path: str
+    offset: int
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+
+    @abstractmethod
+    def _load(self, entry: Dict[str, Any]) -> None:
+        pass
+
+    def _read(self, f) -> bool:
+        # A line without its newline is still being written, it is read the next time
+        f.seek(self.offset)
+        data = f.read()
+        complete = data.rfind(b'\n') + 1
+        self.offset += complete
+        for line in data[:complete].decode('utf-8', 'replace').splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Empty, or left behind by a process that was killed while writing it
+                continue
+            self._load(entry)
+        return complete > 0
+
+    def refresh(self) -> bool:
+        # Only reads what was appended since the last time, possibly by other processes
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return self._read(f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append(self, make_entry: Callable[[], Union[Dict[str, Any], None]]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Reading and appending under the same lock, so the new line is not read back as one of another process
+        with open(self.path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._read(f)
+                entry = make_entry()
+                if entry is None:
+                    return
+                line = (json.dumps(entry) + '\n').encode('utf-8')
+                # Nobody else can be writing now, so an unfinished line is left over from a crash and gets terminated
+                if f.seek(0, os.SEEK_END) > self.offset:
+                    line = b'\n' + line
+                f.write(line)
+                f.flush()
+                self.offset = f.tell()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class GlyphCache(SharedLog):
+
+    exact: Dict[str, int]
+    templates: List[Tuple[float, np.ndarray, int]]
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.exact = {}
+        self.templates = []
+
+    def _add(self, bitmap: np.ndarray, value: int, verified: bool) -> None:
+        self.exact[glyph_key(bitmap)] = value
+        # Tesseract is sometimes wrong, so only glyphs a human confirmed are used for similar looking ones
+        if verified:
+            self.templates.append((bitmap.shape[1] / bitmap.shape[0], normalize_glyph(bitmap), value))
 
+    def _load(self, entry: Dict[str, Any]) -> None:
+        shape = tuple(entry['shape'])
+        bits = np.unpackbits(np.frombuffer(bytes.fromhex(entry['bits']), dtype=np.uint8))
+        self._add(bits[:shape[0] * shape[1]].reshape(shape).astype(bool), entry['value'], entry.get('verified', False))
 
-tesseract_fixes = {}
+    def _find(self, bitmap: np.ndarray) -> Union[int, None]:
+        key = glyph_key(bitmap)
+        if key in self.exact:
+            return self.exact[key]
+        aspect = bitmap.shape[1] / bitmap.shape[0]
+        normalized = normalize_glyph(bitmap)
+        distances = {}
+        for template_aspect, template, value in self.templates:
+            if abs(template_aspect - aspect) > TEMPLATE_MAX_ASPECT_DIFFERENCE * aspect:
+                continue
+            distance = np.count_nonzero(template != normalized) / template.size
+            distances[value] = min(distance, distances.get(value, distance))
+        if not distances:
+            return None
+        ranked = sorted(distances.items(), key=lambda item: item[1])
+        best, best_distance = ranked[0]
+        # A wrong number is much worse than a call to Tesseract, so anything ambiguous goes there
+        if best_distance > TEMPLATE_MAX_DISTANCE:
+            return None
+        if len(ranked) > 1 and ranked[1][1] - best_distance < TEMPLATE_MIN_MARGIN:
+            return None
+        return best
 
+    def lookup(self, region: np.ndarray) -> Union[int, None]:
+        bitmap = glyph_bitmap(region)
+        value = self._find(bitmap)
+        if value is None and self.refresh():
+            value = self._find(bitmap)
+        return value
 
-def find_number_with_tesseract(region: Image) -> int:
-    text = pytesseract.image_to_string(region, config='--psm 8 "{}"'.format(os.path.join(OCR_PATH, 'config'))).strip()
+    def learn(self, region: np.ndarray, value: int, verified: bool = False) -> None:
+        bitmap = glyph_bitmap(region)
+
+        def entry() -> Union[Dict[str, Any], None]:
+            if self.exact.get(glyph_key(bitmap)) == value and not verified:
+                return None
+            self._add(bitmap, value, verified)
+            return {'shape': list(bitmap.shape), 'bits': np.packbits(bitmap).tobytes().hex(), 'value': value, 'verified': verified}
+
+        self._append(entry)
+
+
+def perceptual_hash(region: np.ndarray) -> int:
+    # Average hash: which blocks of an 8x8 grid are darker than the whole glyph, so small differences in the crop do not matter
+    gray = region.mean(axis=-1)
+    rows = np.arange(HASH_SIZE) * gray.shape[0] // HASH_SIZE
+    cols = np.arange(HASH_SIZE) * gray.shape[1] // HASH_SIZE
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    sizes = np.add.reduceat(np.add.reduceat(np.ones_like(gray), rows, axis=0), cols, axis=1)
+    blocks = sums / sizes
+    return int(''.join('1' if dark else '0' for dark in (blocks < blocks.mean()).flat), 2)
+
+
+class CorrectionStore(SharedLog):
+
+    corrections: Dict[str, List[Tuple[int, int]]]
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.corrections = {}
+
+    def _load(self, entry: Dict[str, Any]) -> None:
+        self.corrections.setdefault(entry['text'], []).append((int(entry['hash'], 16), entry['value']))
+
+    def _find(self, text: str, region_hash: int) -> Union[int, None]:
+        best = None
+        best_distance = CORRECTION_MAX_DISTANCE
+        for known_hash, value in self.corrections.get(text, []):
+            distance = bin(known_hash ^ region_hash).count('1')
+            if distance <= best_distance:
+                best = value
+                best_distance = distance
+        return best
+
+    def lookup(self, text: str, region: np.ndarray) -> Union[int, None]:
+        region_hash = perceptual_hash(region)
+        value = self._find(text, region_hash)
+        if value is None:
+            self.refresh()
+            value = self._find(text, region_hash)
+        return value
+
+    def learn(self, text: str, region: np.ndarray, value: int) -> None:
+        region_hash = perceptual_hash(region)
+
+        def entry() -> Dict[str, Any]:
+            self.corrections.setdefault(text, []).append((region_hash, value))
+            return {'text': text, 'hash': '{:016x}'.format(region_hash), 'value': value}
+
+        self._append(entry)
+
+
+glyph_cache = GlyphCache(os.path.join(DATA_PATH, 'glyphs.jsonl'))
+corrections = CorrectionStore(os.path.join(DATA_PATH, 'corrections.jsonl'))
+ask_for_fixes = True
+
+
+def read_text_with_tesseract(region: Image) -> str:
+    return pytesseract.image_to_string(region, config='--psm 8 "{}"'.format(os.path.join(OCR_PATH, 'config'))).strip()
+
+
+def fix_tesseract_text(text: str, region: Image) -> int:
     if text.isdigit():
         return int(text)
-    if text in tesseract_fixes:
-        return tesseract_fixes[text]
+    pixels = image_to_array(region)
+    value = corrections.lookup(text, pixels)
+    if value is not None:
+        return value
+    if not ask_for_fixes:
+        return 0
     # TODO teach Tesseract that it should only detect numbers
     print('Could not detect number, got:', text)
     save_region(region, 'not detect')
     region.show()
     value = input()
     if value.isdigit():
-        tesseract_fixes[text] = int(value)
+        corrections.learn(text, pixels, int(value))
+        # Learned as confirmed by a human, so it is also used for similar glyphs and never goes to Tesseract again
+        glyph_cache.learn(pixels, int(value), True)
         return int(value)
     return 0
 
 
-def detect_number(region: Image) -> int:
-    region = cut_off_border(region)
-    if region is None or is_empty(region):
-        return 0
-    region = crop_content(region)
-    number = find_number_with_tesseract(region)
-    return number
+def tile_regions(regions: List[np.ndarray]) -> Tuple[np.ndarray, List[int]]:
+    width = max(region.shape[1] for region in regions) + 2 * BATCH_SPACING
+    height = sum(region.shape[0] + BATCH_SPACING for region in regions) + BATCH_SPACING
+    composite = np.full((height, width, 3), 255, dtype=np.uint8)
+    tops = []
+    y = BATCH_SPACING
+    for region in regions:
+        composite[y:y + region.shape[0], BATCH_SPACING:BATCH_SPACING + region.shape[1]] = region
+        tops.append(y)
+        y += region.shape[0] + BATCH_SPACING
+    return composite, tops
+
+
+def read_texts_with_tesseract(regions: List[np.ndarray]) -> List[str]:
+    composite, tops = tile_regions(regions)
+    data = pytesseract.image_to_data(Image.fromarray(composite), config='--psm 6 "{}"'.format(os.path.join(OCR_PATH, 'config')), output_type=pytesseract.Output.DICT)
+    tokens = [[] for _ in regions]
+    for text, left, top, height in zip(data['text'], data['left'], data['top'], data['height']):
+        text = text.strip()
+        if not text:
+            continue
+        center = top + height // 2
+        for i, region in enumerate(regions):
+            if tops[i] - BATCH_SPACING // 2 <= center < tops[i] + region.shape[0] + BATCH_SPACING // 2:
+                tokens[i].append((left, text))
+                break
+    texts = []
+    for region, region_tokens in zip(regions, tokens):
+        if region_tokens:
+            texts.append(''.join(text for _, text in sorted(region_tokens)))
+        else:
+            texts.append(read_text_with_tesseract(Image.fromarray(region)))
+    return texts
+
+
+def find_numbers_with_tesseract(regions: List[np.ndarray], workers: int = 1) -> List[int]:
+    if workers > 1 and len(regions) > 1:
+        chunk_size = -(-len(regions) // workers)
+        chunks = [regions[i:i + chunk_size] for i in range(0, len(regions), chunk_size)]
+        with ProcessPoolExecutor(workers) as executor:
+            texts = [text for chunk_texts in executor.map(read_texts_with_tesseract, chunks) for text in chunk_texts]
+    else:
+        texts = read_texts_with_tesseract(regions)
+    # Asking for corrections happens here, after all workers are done
+    return [fix_tesseract_text(text, Image.fromarray(region)) for region, text in zip(regions, texts)]
+
+
+def detect_numbers_array(regions: List[np.ndarray], workers: int = 1) -> List[int]:
+    numbers = [0] * len(regions)
+    unknown = []
+    for i, region in enumerate(regions):
+        region = cut_off_border_array(region)
+        if region is None or is_empty_array(region):
+            continue
+        region = crop_content_array(region)
+        number = glyph_cache.lookup(region)
+        if number is None:
+            unknown.append((i, region))
+        else:
+            numbers[i] = number
+    if unknown:
+        found = find_numbers_with_tesseract([region for _, region in unknown], workers)
+        for (i, region), number in zip(unknown, found):
+            if number > 0:
+                glyph_cache.learn(region, number)
+            numbers[i] = number
+    return numbers
 
 
 def save_region(region: Image, message: str) -> None:
@@ -1,4 +1,4 @@
-from solver import Nonogram, CellState
+from solver import Nonogram, CellState, SolveTrace
 
 
 def _print_puzzle(puzzle: Nonogram, col_width: int, hint_value, cell_value) -> None:
@@ -53,3 +53,9 @@ def print_puzzle_debug(puzzle: Nonogram) -> None:
 
 def print_puzzle(puzzle: Nonogram) -> None:
     _print_puzzle(puzzle, 4, None, None)
+
+
+def print_trace(trace: SolveTrace) -> None:
+    print('{:<24}{:>8}{:>12}{:>8}{:>8}'.format('pass', 'runs', 'time (ms)', 'cells', 'lines'))
+    for total in trace.totals().values():
+        print('{:<24}{:>8}{:>12.3f}{:>8}{:>8}'.format(total.name, total.iteration, total.time * 1000, total.cells, total.lines))
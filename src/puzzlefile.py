@@ -0,0 +1,63 @@
+import json
+from typing import Iterator, TextIO, Dict, Any, List, Union
+
+from compact import CompactNonogram
+from solver import Nonogram, CellState
+
+CELL_CHARS = {
+    CellState.FREE: '.',
+    CellState.MARKED: '#',
+    CellState.BLOCKED: 'x',
+}
+CHAR_CELLS = {char: state for state, char in CELL_CHARS.items()}
+
+
+class PuzzleFormatError(ValueError):
+    pass
+
+
+def puzzle_from_dict(data: Dict[str, Any], compact: bool = False) -> Nonogram:
+    rows = data['rows']
+    columns = data['columns']
+    puzzle = (CompactNonogram if compact else Nonogram)(len(columns), len(rows))
+    for y, row in enumerate(rows):
+        for value in row:
+            puzzle.add_horizontal_hint(y, value)
+    for x, column in enumerate(columns):
+        for value in column:
+            puzzle.add_vertical_hint(x, value)
+    grid = data.get('grid')
+    if grid:
+        if len(grid) != puzzle.height or any(len(line) != puzzle.width for line in grid):
+            raise ValueError('Grid does not match the size of the clues')
+        for y, line in enumerate(grid):
+            for x, char in enumerate(line):
+                puzzle.puzzle[y][x].cell.initial_state = CHAR_CELLS[char]
+    return puzzle
+
+
+def grid_to_lines(puzzle: Nonogram) -> List[str]:
+    return [''.join(CELL_CHARS[cell.cell.state] for cell in row) for row in puzzle.puzzle]
+
+
+def puzzle_to_dict(puzzle: Nonogram) -> Dict[str, Any]:
+    return {
+        'rows': [[hint.value for hint in row] for row in puzzle.horizontal],
+        'columns': [[hint.value for hint in column] for column in puzzle.vertical],
+        'grid': grid_to_lines(puzzle),
+    }
+
+
+def read_puzzles(f: TextIO) -> Iterator[Union[Dict[str, Any], PuzzleFormatError]]:
+    # A broken line is passed on as its error, so it gets a record of its own instead of ending the batch
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield PuzzleFormatError('Line {}: {}'.format(number, e))
+
+
+def write_record(f: TextIO, record: Dict[str, Any]) -> None:
+    print(json.dumps(record), file=f, flush=True)
@@ -1,13 +1,15 @@
-import os
+import queue
 import subprocess
-import tempfile
-from typing import Tuple, Union, List
+import threading
+from typing import Tuple, Union, List, Dict
 
 import time
-from PIL import Image
+import numpy as np
 
 import number_detection
-from solver import Nonogram, CellState
+from capture import ScreenCapture, ImportCapture
+from strokes import plan_strokes, stroke_cells
+from solver import Nonogram, CellState, SolveTrace
 
 
 BORDER_COLOR = (26, 105, 199)
@@ -21,34 +23,47 @@ class PuzzleManager:
 
     wid: str
     window_name: str
+    capture: ScreenCapture
     puzzle: Union[Nonogram, None]
     puzzle_box: Tuple[int, int, int, int]
     col_start: [int]
     col_end: [int]
     row_start: [int]
     row_end: [int]
+    read_times: Dict[str, float]
 
-    def __init__(self, window_name: str):
+    def __init__(self, window_name: str, capture: Union[ScreenCapture, None] = None):
         self.wid = '0'
         self.window_name = window_name
+        self.capture = capture or ImportCapture()
         self.puzzle = None
         self.puzzle_box = (0, 0, 0, 0)
         self.col_start = []
         self.col_end = []
         self.row_start = []
         self.row_end = []
+        self.read_times = {}
 
     def focus_window(self) -> None:
         res = subprocess.run(['xdotool', 'search', '--onlyvisible', '--limit', '1', '--sync', '--name', self.window_name], stdout=subprocess.PIPE)
         self.wid = res.stdout.decode('utf-8').strip()
         subprocess.run(['xdotool', 'windowactivate', '--sync', self.wid])
 
-    def get_screenshot(self, destination: str, delay1: float = 0.2, delay2: float = 0.2) -> None:
-        time.sleep(delay1)
+    def active_window(self) -> str:
+        res = subprocess.run(['xdotool', 'getactivewindow'], stdout=subprocess.PIPE)
+        return res.stdout.decode('utf-8').strip()
+
+    def get_screenshot(self, timeout: float = 2.0, interval: float = 0.02, quiet: bool = False) -> np.ndarray:
+        # A quiet capture leaves focus and mouse alone, e.g. to watch the board while the user plays
+        if quiet or not self.capture.interactive:
+            return self.capture.capture(self.wid)
         self.focus_window()
+        # Asking the window manager is a lot cheaper than comparing full captures
+        deadline = time.monotonic() + timeout
+        while self.active_window() != self.wid and time.monotonic() < deadline:
+            time.sleep(interval)
         self.move_mouse(0, 0)
-        time.sleep(delay2)
-        subprocess.run(['import', '-silent', '-window', self.wid, destination])
+        return self.capture.capture(self.wid)
 
     def move_mouse(self, x: int, y: int) -> None:
         subprocess.run(['xdotool', 'mousemove', '--window', self.wid, str(x), str(y)])
@@ -56,72 +71,92 @@ class PuzzleManager:
     def mouse_click(self, x: int, y: int, button: int) -> None:
         subprocess.run(['xdotool', 'mousemove', '--window', self.wid, str(x), str(y), 'click', str(button)])
 
-    def click_cell(self, x: int, y: int, button: int) -> None:
+    def mouse_clicks(self, clicks: List[Tuple[int, int, int]], chunk_size: int = 0, delay: float = 0.0) -> None:
+        if not clicks:
+            return
+        chunk_size = chunk_size or len(clicks)
+        for i in range(0, len(clicks), chunk_size):
+            script = []
+            for x, y, button in clicks[i:i + chunk_size]:
+                script.append('mousemove --window {} {} {} click {}'.format(self.wid, x, y, button))
+                if delay > 0:
+                    script.append('sleep {}'.format(delay))
+            subprocess.run(['xdotool', '-'], input='\n'.join(script) + '\n', universal_newlines=True)
+
+    def mouse_strokes(self, strokes: List[Tuple[List[Tuple[int, int]], int]], chunk_size: int = 0, delay: float = 0.0) -> None:
+        if not strokes:
+            return
+        chunk_size = chunk_size or len(strokes)
+        for i in range(0, len(strokes), chunk_size):
+            script = []
+            for points, button in strokes[i:i + chunk_size]:
+                script.append('mousemove --window {} {} {} mousedown {}'.format(self.wid, points[0][0], points[0][1], button))
+                # Every point on the way is visited, so pages that fill cells on mouseover do not skip any
+                for x, y in points[1:]:
+                    script.append('mousemove --window {} {} {}'.format(self.wid, x, y))
+                script.append('mouseup {}'.format(button))
+                if delay > 0:
+                    script.append('sleep {}'.format(delay))
+            subprocess.run(['xdotool', '-'], input='\n'.join(script) + '\n', universal_newlines=True)
+
+    def get_cell_screen_coords(self, x: int, y: int) -> Tuple[int, int]:
         center = self.get_cell_center_coords(x, y)
-        self.mouse_click(center[0] + self.puzzle_box[0], center[1] + self.puzzle_box[1], button)
-
-    def get_puzzle_box(self, im: Image) -> Tuple[int, int, int, int]:
-        mid = im.size[0]//2
-        top = -1
-        bottom = -1
-        left = -1
-        right = -1
+        return center[0] + self.puzzle_box[0], center[1] + self.puzzle_box[1]
+
+    def click_cell(self, x: int, y: int, button: int) -> None:
+        screen_x, screen_y = self.get_cell_screen_coords(x, y)
+        self.mouse_click(screen_x, screen_y, button)
+
+    @staticmethod
+    def _first(mask: np.ndarray, default: int) -> int:
+        return int(mask.argmax()) if mask.any() else default
+
+    def get_puzzle_box_array(self, pixels: np.ndarray) -> Tuple[int, int, int, int]:
+        mid = pixels.shape[1] // 2
         # Find border
-        for y in range(im.size[1]):
-            if im.getpixel((mid, y)) == BORDER_COLOR:
-                is_border = True
-                for x in range(mid-5, mid+5):
-                    if im.getpixel((x, y)) != BORDER_COLOR:
-                        is_border = False
-                if is_border:
-                    top = y
-                    break
+        top = self._first((pixels[:, mid-5:mid+5] == BORDER_COLOR).all(axis=(1, 2)), -1)
         # Move to top line
-        for y in range(top, im.size[1]):
-            if im.getpixel((mid, y)) == LINE_COLOR:
-                top = y
-                break
+        top += self._first((pixels[top:, mid] == LINE_COLOR).all(axis=-1), 0)
         # Find right border
-        for x in range(mid, im.size[0]):
-            if im.getpixel((x, top)) != LINE_COLOR:
-                right = x - 1
-                break
+        right = mid + self._first((pixels[top, mid:] != LINE_COLOR).any(axis=-1), -mid) - 1
         # Find bottom border
-        for y in range(top, im.size[1]):
-            if im.getpixel((right, y)) != LINE_COLOR:
-                bottom = y - 1
-                break
+        bottom = top + self._first((pixels[top:, right] != LINE_COLOR).any(axis=-1), -top) - 1
         # Find left border
-        for x in range(mid, 0, -1):
-            if im.getpixel((x, bottom)) != LINE_COLOR:
-                left = x + 1
-                break
+        left = mid - self._first((pixels[bottom, mid:0:-1] != LINE_COLOR).any(axis=-1), mid + 2) + 1
         return left, top, right + 1, bottom + 1
 
-    def get_cell_count(self, im: Image, dx: int, dy: int) -> Tuple[int, List[int], List[int]]:
+    def get_cell_count_array(self, pixels: np.ndarray, dx: int, dy: int) -> Tuple[int, List[int], List[int]]:
+        size = min(pixels.shape[:2])
+        steps = np.arange(size)
+        diagonal = (pixels[pixels.shape[0] - 1 - steps, pixels.shape[1] - 1 - steps] == BACKGROUND_COLOR).all(axis=-1)
+        steps = self._first(diagonal, size)
+        cx = pixels.shape[1] - 1 - steps
+        cy = pixels.shape[0] - 1 - steps
         if dx > 0:
-            value_choose = lambda x, y: x
+            line = (pixels[cy, :cx + 1] == BACKGROUND_COLOR).all(axis=-1)
+            c = cx
+            other = cy
         else:
-            value_choose = lambda x, y: y
+            line = (pixels[:cy + 1, cx] == BACKGROUND_COLOR).all(axis=-1)
+            c = cy
+            other = cx
+        # Walk over whole runs of background and line pixels instead of single pixels
+        run_starts = np.flatnonzero(np.concatenate(([True], line[1:] != line[:-1])))
+
+        def skip(c: int, is_background: bool) -> int:
+            if c <= 0 or line[c] != is_background:
+                return c
+            return max(int(run_starts[np.searchsorted(run_starts, c, side='right') - 1]) - 1, 0)
+
         starts = []
-        ends = []
-        cx = im.size[0] - 1
-        cy = im.size[1] - 1
-        while im.getpixel((cx, cy)) != BACKGROUND_COLOR:
-            cx -= 1
-            cy -= 1
-        ends.append(value_choose(cx, cy))
+        ends = [c]
         count = 0
-        while cx > 0 and cy > 0:
+        while c > 0 and other > 0:
             count += 1
-            while cx > 0 and cy > 0 and im.getpixel((cx, cy)) == BACKGROUND_COLOR:
-                cx -= dx
-                cy -= dy
-            starts.append(value_choose(cx + dx, cy + dy))
-            while cx > 0 and cy > 0 and im.getpixel((cx, cy)) != BACKGROUND_COLOR:
-                cx -= dx
-                cy -= dy
-            ends.append(value_choose(cx, cy))
+            c = skip(c, True)
+            starts.append(c + 1)
+            c = skip(c, False)
+            ends.append(c)
         ends.pop()
         starts.reverse()
         ends.reverse()
@@ -134,74 +169,198 @@ class PuzzleManager:
     def get_cell_size(self, x: int, y: int) -> Tuple[int, int]:
         return self.col_end[x+1] - self.col_start[x+1], self.row_end[y+1] - self.row_start[y+1]
 
-    def fill_cells(self, puzzle_region: Image) -> None:
+    def read_cell_states_array(self, pixels: np.ndarray) -> List[List[CellState]]:
+        xs = np.array([self.get_cell_center_coords(x, 0)[0] for x in range(self.puzzle.width)])
+        ys = np.array([self.get_cell_center_coords(0, y)[1] for y in range(self.puzzle.height)])
+        colors = pixels[ys[:, None], xs[None, :]]
+        marked = (colors == MARKED_COLOR).all(axis=-1)
+        crossed = (colors == CROSS_COLOR).all(axis=-1)
+        states = []
         for y in range(self.puzzle.height):
+            states.append([])
             for x in range(self.puzzle.width):
-                color = puzzle_region.getpixel(self.get_cell_center_coords(x, y))
-                if color == MARKED_COLOR:
-                    self.puzzle.puzzle[y][x].cell.initial_state = CellState.MARKED
-                elif color == CROSS_COLOR:
-                    self.puzzle.puzzle[y][x].cell.initial_state = CellState.BLOCKED
+                if marked[y, x]:
+                    states[y].append(CellState.MARKED)
+                elif crossed[y, x]:
+                    states[y].append(CellState.BLOCKED)
                 else:
-                    self.puzzle.puzzle[y][x].cell.initial_state = CellState.FREE
+                    states[y].append(CellState.FREE)
+        return states
+
+    def fill_cells_array(self, pixels: np.ndarray) -> None:
+        for y, row in enumerate(self.read_cell_states_array(pixels)):
+            for x, state in enumerate(row):
+                self.puzzle.puzzle[y][x].cell.initial_state = state
 
-    def read_hints(self, puzzle_region: Image) -> None:
+    def read_cell_changes(self) -> List[Tuple[int, int, CellState]]:
+        # The window was found by read_puzzle, so there is no need to take it over again
+        pixels = self.get_screenshot(quiet=True)
+        puzzle_region = pixels[self.puzzle_box[1]:self.puzzle_box[3], self.puzzle_box[0]:self.puzzle_box[2]]
+        changes = []
+        for y, row in enumerate(self.read_cell_states_array(puzzle_region)):
+            for x, state in enumerate(row):
+                if self.puzzle.puzzle[y][x].cell.initial_state != state:
+                    changes.append((x, y, state))
+        return changes
+
+    def read_hints(self, pixels: np.ndarray, workers: int = 1) -> None:
         horizontal_hints_size = self.get_cell_size(-1, 0)
         vertical_hints_size = self.get_cell_size(0, -1)
         horizontal_hint_count = horizontal_hints_size[0] // self.get_cell_size(0, 0)[0]
         vertical_hint_count = vertical_hints_size[1] // self.get_cell_size(0, 0)[1]
         hint_width = horizontal_hints_size[0] / horizontal_hint_count
         hint_height = vertical_hints_size[1] / vertical_hint_count
+        slots = []
+        regions = []
         for y in range(self.puzzle.height):
             for x in range(horizontal_hint_count):
-                region = puzzle_region.crop((self.col_start[0] + int(x * hint_width), self.row_start[y+1], self.col_start[0] + int((x + 1) * hint_width) + 1, self.row_end[y+1] + 1))
-                number = number_detection.detect_number(region)
-                if number > 0:
-                    self.puzzle.add_horizontal_hint(y, number)
+                slots.append((False, y))
+                regions.append(pixels[self.row_start[y+1]:self.row_end[y+1] + 1, self.col_start[0] + int(x * hint_width):self.col_start[0] + int((x + 1) * hint_width) + 1])
         for x in range(self.puzzle.width):
             for y in range(vertical_hint_count):
-                region = puzzle_region.crop((self.col_start[x+1], self.row_start[0] + int(y * hint_height), self.col_end[x+1] + 1, self.row_start[0] + int((y+1) * hint_height) + 1))
-                number = number_detection.detect_number(region)
-                if number > 0:
-                    self.puzzle.add_vertical_hint(x, number)
+                slots.append((True, x))
+                regions.append(pixels[self.row_start[0] + int(y * hint_height):self.row_start[0] + int((y+1) * hint_height) + 1, self.col_start[x+1]:self.col_end[x+1] + 1])
+        numbers = number_detection.detect_numbers_array(regions, workers)
+        for (vertical, index), number in zip(slots, numbers):
+            if number > 0:
+                if vertical:
+                    self.puzzle.add_vertical_hint(index, number)
+                else:
+                    self.puzzle.add_horizontal_hint(index, number)
+
+    def read_puzzle(self, workers: int = 1) -> None:
+        self.read_times = {}
+        last = time.perf_counter()
+
+        def stage(name: str) -> None:
+            nonlocal last
+            now = time.perf_counter()
+            self.read_times[name] = now - last
+            last = now
 
-    def read_puzzle(self) -> None:
         number_detection.init_tesseract()
-        with tempfile.TemporaryDirectory(prefix='Nonogram') as tempdir:
-            screenshot = os.path.join(tempdir, 'screen.png')
-            self.get_screenshot(screenshot)
-            im = Image.open(screenshot)
-        self.puzzle_box = self.get_puzzle_box(im)
-        self.move_mouse(self.puzzle_box[2], self.puzzle_box[3])
-        puzzle_region = im.crop(self.puzzle_box)
-        width, self.col_start, self.col_end = self.get_cell_count(puzzle_region, 1, 0)
-        height, self.row_start, self.row_end = self.get_cell_count(puzzle_region, 0, 1)
+        stage('init')
+        pixels = self.get_screenshot()
+        stage('screenshot')
+        self.puzzle_box = self.get_puzzle_box_array(pixels)
+        if self.capture.interactive:
+            self.move_mouse(self.puzzle_box[2], self.puzzle_box[3])
+        stage('puzzle_box')
+        puzzle_region = pixels[self.puzzle_box[1]:self.puzzle_box[3], self.puzzle_box[0]:self.puzzle_box[2]]
+        width, self.col_start, self.col_end = self.get_cell_count_array(puzzle_region, 1, 0)
+        height, self.row_start, self.row_end = self.get_cell_count_array(puzzle_region, 0, 1)
+        stage('cell_count')
         self.puzzle = Nonogram(width, height)
-        self.fill_cells(puzzle_region)
-        self.read_hints(puzzle_region)
+        self.fill_cells_array(puzzle_region)
+        stage('fill_cells')
+        self.read_hints(puzzle_region, workers)
+        stage('read_hints')
 
-    def _apply_cell(self, x: int, y: int, crosses):
+    def _cell_button(self, x: int, y: int, crosses: bool) -> int:
         initial = self.puzzle.puzzle[y][x].cell.initial_state
         state = self.puzzle.puzzle[y][x].cell.state
         if initial != state:
             if state == CellState.MARKED:
-                self.click_cell(x, y, 1)
+                return 1
             elif state == CellState.BLOCKED:
                 if crosses:
-                    self.click_cell(x, y, 3)
+                    return 3
             elif initial == CellState.MARKED:
-                self.click_cell(x, y, 1)
+                return 1
             elif initial == CellState.BLOCKED:
                 if crosses:
-                    self.click_cell(x, y, 3)
+                    return 3
+        return 0
+
+    def _apply_cell(self, x: int, y: int, crosses):
+        button = self._cell_button(x, y, crosses)
+        if button:
+            self.click_cell(x, y, button)
+
+    def _apply_cells(self, cells: List[Tuple[int, int]], crosses: bool, chunk_size: Union[int, None], delay: float) -> None:
+        if chunk_size is None:
+            for x, y in cells:
+                self._apply_cell(x, y, crosses)
+            return
+        clicks = []
+        for x, y in cells:
+            button = self._cell_button(x, y, crosses)
+            if button:
+                clicks.append(self.get_cell_screen_coords(x, y) + (button,))
+        self.mouse_clicks(clicks, chunk_size, delay)
+
+    def apply_puzzle_in_solve_order(self, crosses=True, chunk_size: Union[int, None] = None, delay: float = 0.0, by_step: bool = False, step_delay: float = 0.0) -> None:
+        self.focus_window()
+        if not by_step:
+            self._apply_cells(self.puzzle.solve_order, crosses, chunk_size, delay)
+            return
+        # Cells found in the same pass are entered together, row by row
+        for i, group in enumerate(self.puzzle.solve_groups()):
+            if i > 0 and step_delay > 0:
+                time.sleep(step_delay)
+            self._apply_cells(sorted(group, key=lambda cell: (cell[1], cell[0])), crosses, chunk_size, delay)
 
-    def apply_puzzle_in_solve_order(self, crosses=True) -> None:
+    def solve_and_apply(self, crosses=True, chunk_size: Union[int, None] = None, delay: float = 0.0, engine: str = 'classic', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, trace: Union[SolveTrace, None] = None) -> bool:
         self.focus_window()
-        for x, y in self.puzzle.solve_order:
-            self._apply_cell(x, y, crosses)
+        cells = queue.Queue()
+        streamed = set()
+
+        def found(x: int, y: int) -> None:
+            streamed.add((x, y))
+            cells.put((x, y))
+
+        def apply() -> None:
+            done = False
+            while not done:
+                # Take everything the solver found in the meantime, so batched clicks stay batched
+                batch = [cells.get()]
+                while not cells.empty():
+                    batch.append(cells.get())
+                if None in batch:
+                    done = True
+                    batch.remove(None)
+                self._apply_cells(batch, crosses, chunk_size, delay)
+
+        thread = threading.Thread(target=apply)
+        thread.start()
+        self.puzzle.order_listener = found
+        solved = None
+        try:
+            solved = self.puzzle.solve(engine, search, max_nodes, time_limit, trace)
+        finally:
+            self.puzzle.order_listener = None
+            # Cells found by the search are held back by the solver until it is done, a failed search leaves only guesses
+            if solved is not None:
+                for cell in self.puzzle.solve_order:
+                    if cell not in streamed:
+                        cells.put(cell)
+            cells.put(None)
+            thread.join()
+        return solved
 
-    def apply_puzzle(self, crosses=True) -> None:
+    def apply_puzzle(self, crosses=True, chunk_size: Union[int, None] = None, delay: float = 0.0) -> None:
         self.focus_window()
+        cells = [(x, y) for y in range(self.puzzle.height) for x in range(self.puzzle.width)]
+        self._apply_cells(cells, crosses, chunk_size, delay)
+
+    def apply_puzzle_with_strokes(self, crosses=True, chunk_size: int = 0, delay: float = 0.0) -> None:
+        self.focus_window()
+        marks = []
+        crossings = []
+        strokes = []
         for y in range(self.puzzle.height):
             for x in range(self.puzzle.width):
-                self._apply_cell(x, y, crosses)
+                button = self._cell_button(x, y, crosses)
+                cell = self.puzzle.puzzle[y][x].cell
+                # Dragging sets every cell to the state of the first one, so only free cells are dragged over
+                if button == 1 and cell.initial_state == CellState.FREE and cell.state == CellState.MARKED:
+                    marks.append((x, y))
+                elif button == 3 and cell.initial_state == CellState.FREE and cell.state == CellState.BLOCKED:
+                    crossings.append((x, y))
+                elif button:
+                    # Cells that already had a state are clicked one by one
+                    strokes.append(([self.get_cell_screen_coords(x, y)], button))
+        for cells, button in ((marks, 1), (crossings, 3)):
+            for stroke in plan_strokes(cells):
+                strokes.append(([self.get_cell_screen_coords(x, y) for x, y in stroke_cells(stroke)], button))
+        self.mouse_strokes(strokes, chunk_size, delay)
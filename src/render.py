@@ -0,0 +1,67 @@
+from typing import Union
+
+from PIL import Image, ImageDraw, ImageFont
+
+from puzzlemanager import BORDER_COLOR, LINE_COLOR, BACKGROUND_COLOR, CROSS_COLOR, MARKED_COLOR
+from solver import Nonogram, CellState
+
+FONT_NAME = 'DejaVuSans-Bold.ttf'
+CELL_SIZE = 20
+FONT_SIZE = 0.55
+MARGIN = 20
+BORDER_WIDTH = 4
+BORDER_PADDING = 10
+
+
+def load_font(size: int, path: Union[str, None] = None) -> ImageFont.FreeTypeFont:
+    try:
+        return ImageFont.truetype(path or FONT_NAME, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def render_puzzle(puzzle: Nonogram, cell_size: int = CELL_SIZE, scale: float = 1.0, states: bool = True, font: Union[str, None] = None) -> Image:
+    cell = max(round(cell_size * scale), 8)
+    line = max(round(scale), 1)
+    step = cell + line
+    hint_columns = max(1, max(len(row) for row in puzzle.horizontal))
+    hint_rows = max(1, max(len(column) for column in puzzle.vertical))
+    outside = round((MARGIN + BORDER_WIDTH + BORDER_PADDING) * scale)
+    # Grid lines, the first one is in front of the hints, which are not separated by lines
+    xs = [outside] + [outside + line + hint_columns * cell + i * step for i in range(puzzle.width + 1)]
+    ys = [outside] + [outside + line + hint_rows * cell + i * step for i in range(puzzle.height + 1)]
+    image = Image.new('RGB', (xs[-1] + line + outside, ys[-1] + line + outside), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(image)
+    margin = round(MARGIN * scale)
+    draw.rectangle((margin, margin, image.size[0] - margin - 1, image.size[1] - margin - 1), outline=BORDER_COLOR, width=round(BORDER_WIDTH * scale))
+    for x in xs:
+        draw.rectangle((x, ys[0], x + line - 1, ys[-1] + line - 1), fill=LINE_COLOR)
+    for y in ys:
+        draw.rectangle((xs[0], y, xs[-1] + line - 1, y + line - 1), fill=LINE_COLOR)
+
+    text_font = load_font(round(cell * FONT_SIZE), font)
+    for y, row in enumerate(puzzle.horizontal):
+        for i, hint in enumerate(row):
+            slot = hint_columns - len(row) + i
+            draw.text((xs[0] + line + slot * cell + cell // 2, ys[y + 1] + line + cell // 2), str(hint.value), fill=MARKED_COLOR, font=text_font, anchor='mm')
+    for x, column in enumerate(puzzle.vertical):
+        for i, hint in enumerate(column):
+            slot = hint_rows - len(column) + i
+            draw.text((xs[x + 1] + line + cell // 2, ys[0] + line + slot * cell + cell // 2), str(hint.value), fill=MARKED_COLOR, font=text_font, anchor='mm')
+
+    if states:
+        inset = cell // 4
+        for y in range(puzzle.height):
+            for x in range(puzzle.width):
+                left = xs[x + 1] + line
+                top = ys[y + 1] + line
+                state = puzzle.puzzle[y][x].cell.initial_state
+                if state == CellState.MARKED:
+                    draw.rectangle((left, top, left + cell - 1, top + cell - 1), fill=MARKED_COLOR)
+                elif state == CellState.BLOCKED:
+                    right = left + cell - 1 - inset
+                    bottom = top + cell - 1 - inset
+                    width = max(cell // 8, 2)
+                    draw.line((left + inset, top + inset, right, bottom), fill=CROSS_COLOR, width=width)
+                    draw.line((left + inset, bottom, right, top + inset), fill=CROSS_COLOR, width=width)
+    return image
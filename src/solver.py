@@ -1,5 +1,10 @@
+import heapq
+import time
+from collections import OrderedDict
 from enum import Enum
-from typing import List, Any, Set, Tuple
+from typing import List, Any, Set, Tuple, Union, Dict, Iterable, Iterator, Callable
+
+ENGINES = ['classic', 'bitmask', 'numpy']
 
 
 class CellState(Enum):
@@ -8,6 +13,61 @@ class CellState(Enum):
     BLOCKED = 3
 
 
+class Contradiction(Exception):
+    pass
+
+
+class SearchLimitExceeded(Exception):
+    pass
+
+
+class PassRecord:
+
+    iteration: int
+    name: str
+    time: float
+    cells: int
+    lines: int
+
+    def __init__(self, iteration: int, name: str, time: float, cells: int, lines: int):
+        self.iteration = iteration
+        self.name = name
+        self.time = time
+        self.cells = cells
+        self.lines = lines
+
+    def __repr__(self):
+        return 'PassRecord <{} {}: {:.6f}s, {} cells, {} lines>'.format(self.iteration, self.name, self.time, self.cells, self.lines)
+
+
+class SolveTrace:
+
+    records: List[PassRecord]
+    callback: Union[Callable[[PassRecord], None], None]
+
+    def __init__(self, callback: Union[Callable[[PassRecord], None], None] = None):
+        self.records = []
+        self.callback = callback
+
+    def add(self, record: PassRecord) -> None:
+        self.records.append(record)
+        if self.callback:
+            self.callback(record)
+
+    def totals(self) -> Dict[str, PassRecord]:
+        # The iteration field of a total holds the number of times the pass ran
+        totals = {}
+        for record in self.records:
+            if record.name not in totals:
+                totals[record.name] = PassRecord(0, record.name, 0.0, 0, 0)
+            total = totals[record.name]
+            total.iteration += 1
+            total.time += record.time
+            total.cells += record.cells
+            total.lines += record.lines
+        return totals
+
+
 class Hint:
 
     value: int
@@ -47,6 +107,118 @@ class RowCell:
         self.possible_hints = set()
 
 
+def _fill_gaps(reach: int, enter: int, size: int, forward: bool) -> int:
+    # Kogge-Stone fill: extend every reachable position through neighbouring non-marked cells
+    shift = 1
+    while shift <= size:
+        if forward:
+            reach |= enter & (reach << shift)
+            enter &= enter << shift
+        else:
+            reach |= enter & (reach >> shift)
+            enter &= enter >> shift
+        shift <<= 1
+    return reach
+
+
+def _valid_starts(value: int, size: int, marked: int, blocked: int) -> int:
+    free = ~blocked & ((1 << size) - 1)
+    starts = free
+    for shift in range(1, value):
+        starts &= free >> shift
+    return starts & ~(marked >> value)
+
+
+def _starts_before(reach: int, value: int, size: int) -> int:
+    # positions p such that a run of value starting at p is followed by a position in reach
+    if value > size:
+        return 0
+    return (reach >> (value + 1)) | ((reach >> value) & (1 << (size - value)))
+
+
+def solve_line(clues: List[int], size: int, marked: int, blocked: int) -> Union[Tuple[int, int, List[int], List[int]], None]:
+    cells = (1 << size) - 1
+    positions = (1 << (size + 1)) - 1
+    free = ~marked & cells
+    starts = [_valid_starts(value, size, marked, blocked) for value in clues]
+    # forward[i] has bit p set if clues [0, i) fit into cells [0, p) and clue i may start at p
+    forward = [_fill_gaps(1, free << 1, size, True)]
+    for i, value in enumerate(clues):
+        reach = forward[-1] & starts[i]
+        reach = ((reach << (value + 1)) | ((reach << value) & (1 << size))) & positions
+        forward.append(_fill_gaps(reach, free << 1, size, True))
+    if not forward[-1] >> size & 1:
+        return None
+    # backward[i] has bit p set if clues [i, k) fit into cells [p, size)
+    backward = [_fill_gaps(1 << size, free, size, False)]
+    for i in range(len(clues) - 1, -1, -1):
+        reach = starts[i] & _starts_before(backward[0], clues[i], size)
+        backward.insert(0, _fill_gaps(reach, free, size, False))
+    can_mark = 0
+    can_blank = 0
+    leftmost = []
+    rightmost = []
+    for i, value in enumerate(clues):
+        placements = forward[i] & starts[i] & _starts_before(backward[i + 1], value, size)
+        if not placements:
+            return None
+        leftmost.append((placements & -placements).bit_length() - 1)
+        rightmost.append(placements.bit_length() - 1)
+        run = placements
+        for shift in range(1, value):
+            run |= placements << shift
+        can_mark |= run
+        can_blank |= placements << value
+    for i in range(len(clues) + 1):
+        can_blank |= forward[i] & (backward[i] >> 1)
+    can_blank &= free
+    new_marked = cells & ~can_blank
+    new_blocked = cells & ~can_mark
+    if new_marked & new_blocked:
+        return None
+    return new_marked, new_blocked, leftmost, rightmost
+
+
+class LineCache:
+
+    maxsize: int
+    hits: int
+    misses: int
+    entries: OrderedDict
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def solve_line(self, clues: Tuple[int, ...], size: int, marked: int, blocked: int) -> Union[Tuple[int, int, List[int], List[int]], None]:
+        key = (clues, size, marked, blocked)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        result = solve_line(list(clues), size, marked, blocked)
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+    def clear(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.entries.clear()
+
+
+# Shared by the searches in this process. Rolled back branches solve the same lines again, while
+# plain line solving never sees a line state twice, so it only pays off while searching.
+line_cache = LineCache()
+
+
 class Nonogram:
 
     width: int
@@ -55,6 +227,20 @@ class Nonogram:
     horizontal: List[List[Hint]]
     vertical: List[List[Hint]]
     solve_order: List[Tuple[int, int]]
+    solve_steps: Dict[Tuple[int, int], Tuple[int, str]]
+    current_pass: str
+    trace: Union[SolveTrace, None]
+    iteration: int
+    line_cache: Union[LineCache, None]
+    pending_lines: Set[Tuple[int, bool]]
+    needs_full_solve: bool
+    order_listener: Union[Callable[[int, int], None], None]
+    searching: bool
+    guess_start: Union[int, None]
+    marked_rows: List[int]
+    blocked_rows: List[int]
+    marked_cols: List[int]
+    blocked_cols: List[int]
 
     def __init__(self, width: int, height: int):
         self.width = width
@@ -63,7 +249,25 @@ class Nonogram:
         self.puzzle_flipped = [[RowCell(self.puzzle[y][x].cell) for y in range(height)] for x in range(width)]
         self.horizontal = [[] for _ in range(height)]
         self.vertical = [[] for _ in range(width)]
+        self._init_state()
+
+    def _init_state(self) -> None:
+        # Everything except the grid and the hints, which CompactNonogram stores differently
         self.solve_order = []
+        self.solve_steps = {}
+        self.current_pass = ''
+        self.trace = None
+        self.iteration = 0
+        self.line_cache = None
+        self.pending_lines = set()
+        self.needs_full_solve = False
+        self.order_listener = None
+        self.searching = False
+        self.guess_start = None
+        self.marked_rows = []
+        self.blocked_rows = []
+        self.marked_cols = []
+        self.blocked_cols = []
 
     def add_horizontal_hint(self, y: int, value: int) -> None:
         self.horizontal[y].append(Hint(value))
@@ -71,9 +275,26 @@ class Nonogram:
     def add_vertical_hint(self, x: int, value: int) -> None:
         self.vertical[x].append(Hint(value))
 
-    def _add_solve_order(self, x: int, y: int):
-        if (x, y) not in self.solve_order:
+    def _add_solve_order(self, x: int, y: int, flipped: bool = False):
+        if flipped:
+            x, y = y, x
+        if (x, y) not in self.solve_steps:
+            self.solve_steps[(x, y)] = (self.iteration, self.current_pass)
             self.solve_order.append((x, y))
+            # Guesses can be rolled back, so only cells found outside of the search are reported
+            if self.order_listener is not None and not self.searching:
+                self.order_listener(x, y)
+
+    def solve_groups(self) -> List[List[Tuple[int, int]]]:
+        groups = []
+        last_step = None
+        for cell in self.solve_order:
+            step = self.solve_steps[cell]
+            if step != last_step:
+                groups.append([])
+                last_step = step
+            groups[-1].append(cell)
+        return groups
 
     def _init_solve(self) -> None:
         for y in range(self.height):
@@ -108,7 +329,7 @@ class Nonogram:
                 for hint in row:
                     for x in range(hint.rightmost, hint.leftmost + hint.value):
                         puzzle[y][x].cell.state = CellState.MARKED
-                        self._add_solve_order(x, y)
+                        self._add_solve_order(x, y, puzzle is self.puzzle_flipped)
         _apply_one_mostness_overlap(self.horizontal, self.puzzle)
         _apply_one_mostness_overlap(self.vertical, self.puzzle_flipped)
 
@@ -157,7 +378,7 @@ class Nonogram:
                 for x, cell in enumerate(puzzle[y]):
                     if not cell.possible_hints:
                         cell.cell.state = CellState.BLOCKED
-                        self._add_solve_order(x, y)
+                        self._add_solve_order(x, y, puzzle is self.puzzle_flipped)
         for row in self.puzzle:
             for cell in row:
                 cell.possible_hints.clear()
@@ -206,11 +427,11 @@ class Nonogram:
                         if hint.leftmost - 1 >= 0:
                             assert puzzle[y][hint.leftmost - 1].cell.state != CellState.MARKED
                             puzzle[y][hint.leftmost - 1].cell.state = CellState.BLOCKED
-                            self._add_solve_order(hint.leftmost - 1, y)
+                            self._add_solve_order(hint.leftmost - 1, y, puzzle is self.puzzle_flipped)
                         if hint.rightmost + hint.value < len(puzzle[y]):
                             assert puzzle[y][hint.rightmost + hint.value].cell.state != CellState.MARKED
                             puzzle[y][hint.rightmost + hint.value].cell.state = CellState.BLOCKED
-                            self._add_solve_order(hint.rightmost + hint.value, y)
+                            self._add_solve_order(hint.rightmost + hint.value, y, puzzle is self.puzzle_flipped)
                 all_done = True
                 for hint in row:
                     if hint.leftmost != hint.rightmost:
@@ -220,29 +441,315 @@ class Nonogram:
                     for x, cell in enumerate(puzzle[y]):
                         if cell.cell.state != CellState.MARKED:
                             cell.cell.state = CellState.BLOCKED
-                            self._add_solve_order(x, y)
+                            self._add_solve_order(x, y, puzzle is self.puzzle_flipped)
         _find_one_finished_cells(self.horizontal, self.puzzle)
         _find_one_finished_cells(self.vertical, self.puzzle_flipped)
 
     def count_known_cells(self) -> int:
         return sum(1 for row in self.puzzle for c in row if c.cell.state != CellState.FREE)
 
-    def solve(self) -> None:
+    @staticmethod
+    def _line_matches(hints: List[Hint], line: List[RowCell]) -> bool:
+        runs = []
+        run = 0
+        for c in line:
+            if c.cell.state == CellState.MARKED:
+                run += 1
+            elif run:
+                runs.append(run)
+                run = 0
+        if run:
+            runs.append(run)
+        return runs == [hint.value for hint in hints]
+
+    def is_solved(self) -> bool:
+        # The classic engine can fill every cell without noticing a contradiction, so the lines are checked again
+        if self.count_known_cells() < self.width * self.height:
+            return False
+        return (all(self._line_matches(hints, row) for hints, row in zip(self.horizontal, self.puzzle))
+                and all(self._line_matches(hints, col) for hints, col in zip(self.vertical, self.puzzle_flipped)))
+
+    def _init_masks(self) -> None:
+        self.marked_rows = [0] * self.height
+        self.blocked_rows = [0] * self.height
+        self.marked_cols = [0] * self.width
+        self.blocked_cols = [0] * self.width
+        for y in range(self.height):
+            for x in range(self.width):
+                state = self.puzzle[y][x].cell.state
+                if state == CellState.MARKED:
+                    self.marked_rows[y] |= 1 << x
+                    self.marked_cols[x] |= 1 << y
+                elif state == CellState.BLOCKED:
+                    self.blocked_rows[y] |= 1 << x
+                    self.blocked_cols[x] |= 1 << y
+
+    def _set_cell_state(self, x: int, y: int, state: CellState) -> None:
+        self.puzzle[y][x].cell.state = state
+        if state == CellState.MARKED:
+            self.marked_rows[y] |= 1 << x
+            self.marked_cols[x] |= 1 << y
+        else:
+            self.blocked_rows[y] |= 1 << x
+            self.blocked_cols[x] |= 1 << y
+        self._add_solve_order(x, y)
+
+    def _solve_line_bitmask(self, index: int, flipped: bool) -> int:
+        if flipped:
+            hints = self.vertical[index]
+            size = self.height
+            marked = self.marked_cols[index]
+            blocked = self.blocked_cols[index]
+        else:
+            hints = self.horizontal[index]
+            size = self.width
+            marked = self.marked_rows[index]
+            blocked = self.blocked_rows[index]
+        if self.line_cache is None:
+            result = solve_line([hint.value for hint in hints], size, marked, blocked)
+        else:
+            result = self.line_cache.solve_line(tuple(hint.value for hint in hints), size, marked, blocked)
+        if result is None:
+            raise Contradiction('No solution for {} {}'.format('column' if flipped else 'row', index))
+        new_marked, new_blocked, leftmost, rightmost = result
+        for hint, left, right in zip(hints, leftmost, rightmost):
+            hint.leftmost = left
+            hint.rightmost = right
+        changed = (new_marked & ~marked) | (new_blocked & ~blocked)
+        remaining = changed
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            i = bit.bit_length() - 1
+            state = CellState.MARKED if new_marked & bit else CellState.BLOCKED
+            if flipped:
+                self._set_cell_state(index, i, state)
+            else:
+                self._set_cell_state(i, index, state)
+        return changed
+
+    def _line_slack(self, index: int, flipped: bool) -> int:
+        hints = self.vertical[index] if flipped else self.horizontal[index]
+        size = self.height if flipped else self.width
+        return size - sum(hint.value for hint in hints) - len(hints) + 1
+
+    def _queue_line(self, queue: List[Tuple[int, int, bool, int]], pending: Dict[Tuple[bool, int], int], index: int, flipped: bool, changes: int) -> None:
+        # Lines with many new cells and little slack are the most likely to yield new cells
+        key = (flipped, index)
+        pending[key] = pending.get(key, 0) + changes
+        heapq.heappush(queue, (-pending[key], self._line_slack(index, flipped), flipped, index))
+
+    def _propagate(self, lines: Iterable[Tuple[int, bool]]) -> None:
+        self.current_pass = 'propagate'
+        queue = []
+        pending = {}
+        for index, flipped in lines:
+            self._queue_line(queue, pending, index, flipped, 0)
+        if self.trace is not None:
+            start = time.perf_counter()
+            known = len(self.solve_order)
+        first_iteration = self.iteration
+        solved_lines = 0
+        try:
+            while queue:
+                changes, _, flipped, index = heapq.heappop(queue)
+                if pending.get((flipped, index)) != -changes:
+                    continue
+                del pending[(flipped, index)]
+                solved_lines += 1
+                # Every line is a step of its own, so solve_groups can replay the propagation line by line
+                self.iteration += 1
+                changed = self._solve_line_bitmask(index, flipped)
+                while changed:
+                    bit = changed & -changed
+                    changed ^= bit
+                    self._queue_line(queue, pending, bit.bit_length() - 1, not flipped, 1)
+        finally:
+            if self.trace is not None:
+                self.trace.add(PassRecord(first_iteration, 'propagate', time.perf_counter() - start, len(self.solve_order) - known, solved_lines))
+            self.iteration += 1
+
+    def _all_lines(self) -> List[Tuple[int, bool]]:
+        return [(y, False) for y in range(self.height)] + [(x, True) for x in range(self.width)]
+
+    def _solve_bitmask(self) -> None:
         self._init_solve()
-        self._calc_mostness()
+        self._init_masks()
+        self._propagate(self._all_lines())
+
+    def _solve_numpy(self) -> None:
+        # Imported here, so that the other engines work without NumPy
+        from vectorized import solve_puzzles
+        if not solve_puzzles([self])[0]:
+            raise Contradiction('Puzzle has no solution')
+
+    def _save_bounds(self) -> Any:
+        bounds = []
+        for hint_list in self.horizontal + self.vertical:
+            for hint in hint_list:
+                bounds.append(hint.leftmost)
+                bounds.append(hint.rightmost)
+        return bounds
+
+    def _load_bounds(self, bounds: Any) -> None:
+        i = 0
+        for hint_list in self.horizontal + self.vertical:
+            for hint in hint_list:
+                hint.leftmost = bounds[i]
+                hint.rightmost = bounds[i + 1]
+                i += 2
+
+    def _free_cell(self, x: int, y: int) -> None:
+        self.puzzle[y][x].cell.state = CellState.FREE
+
+    def _snapshot(self) -> Tuple[List[int], List[int], List[int], List[int], Any, int]:
+        return self.marked_rows[:], self.blocked_rows[:], self.marked_cols[:], self.blocked_cols[:], self._save_bounds(), len(self.solve_order)
+
+    def _restore(self, snapshot: Tuple[List[int], List[int], List[int], List[int], Any, int]) -> None:
+        marked_rows, blocked_rows, marked_cols, blocked_cols, bounds, order_length = snapshot
+        self.marked_rows = marked_rows[:]
+        self.blocked_rows = blocked_rows[:]
+        self.marked_cols = marked_cols[:]
+        self.blocked_cols = blocked_cols[:]
+        self._load_bounds(bounds)
+        # Only cells determined after the snapshot were set, and they were free before
+        for x, y in self.solve_order[order_length:]:
+            self._free_cell(x, y)
+            del self.solve_steps[(x, y)]
+        del self.solve_order[order_length:]
+
+    def _choose_free_cell(self) -> Union[Tuple[int, int], None]:
+        full = (1 << self.width) - 1
+        best = None
+        best_count = self.width + 1
+        for y in range(self.height):
+            free = full & ~(self.marked_rows[y] | self.blocked_rows[y])
+            if free:
+                count = bin(free).count('1')
+                if count < best_count:
+                    best = ((free & -free).bit_length() - 1, y)
+                    best_count = count
+        return best
+
+    def _backtrack(self, stack: List[Tuple[Any, int, int]]) -> bool:
+        # The last guess that still has an untried alternative gets blocked instead
+        while stack:
+            snapshot, x, y = stack.pop()
+            self._restore(snapshot)
+            try:
+                self.current_pass = 'guess'
+                self._set_cell_state(x, y, CellState.BLOCKED)
+                self._propagate([(y, False), (x, True)])
+                return True
+            except Contradiction:
+                pass
+        return False
+
+    def _solutions(self, max_nodes: int, time_limit: float) -> Iterator[bool]:
+        # Yields True whenever the board holds a solution and False once if the budget runs out
+        deadline = time.monotonic() + time_limit
+        nodes = 0
+        stack = []
+        while True:
+            cell = self._choose_free_cell()
+            if cell is None:
+                yield True
+                if not self._backtrack(stack):
+                    return
+                continue
+            if nodes >= max_nodes or time.monotonic() >= deadline:
+                if stack:
+                    self._restore(stack[0][0])
+                yield False
+                return
+            nodes += 1
+            x, y = cell
+            stack.append((self._snapshot(), x, y))
+            try:
+                self.current_pass = 'guess'
+                self._set_cell_state(x, y, CellState.MARKED)
+                self._propagate([(y, False), (x, True)])
+                continue
+            except Contradiction:
+                pass
+            if not self._backtrack(stack):
+                return
+
+    def _search(self, max_nodes: int, time_limit: float) -> bool:
+        self.searching = True
+        # Everything from here on in solve_order rests on guesses, even if it is not one itself
+        if self.guess_start is None:
+            self.guess_start = len(self.solve_order)
+        cache = self._use_search_cache()
+        try:
+            for solved in self._solutions(max_nodes, time_limit):
+                return solved
+            raise Contradiction('Puzzle has no solution')
+        finally:
+            self.searching = False
+            self.line_cache = cache
+
+    def _use_search_cache(self) -> Union[LineCache, None]:
+        # Returns the cache to go back to after the search, a cache set by the caller is kept
+        previous = self.line_cache
+        if previous is None:
+            self.line_cache = line_cache
+        return previous
+
+    def count_solutions(self, limit: int = 2, max_nodes: int = 1000000, time_limit: float = 60.0) -> int:
+        self.solve_order.clear()
+        self.solve_steps.clear()
+        self.guess_start = None
+        self._init_solve()
+        self._init_masks()
+        try:
+            self._propagate(self._all_lines())
+        except Contradiction:
+            return 0
+        # Only the current branch is kept on the stack, so memory grows with the search depth and not the tree size
+        root = self._snapshot()
+        count = 0
+        cache = self._use_search_cache()
+        try:
+            for solved in self._solutions(max_nodes, time_limit):
+                if not solved:
+                    raise SearchLimitExceeded('Found {} solutions before running out of budget'.format(count))
+                count += 1
+                if count >= limit:
+                    break
+        finally:
+            self.line_cache = cache
+        self._restore(root)
+        return count
+
+    def _run_pass(self, method: Callable[[], None]) -> None:
+        self.current_pass = method.__name__.lstrip('_')
+        if self.trace is None:
+            method()
+            return
+        known = self.count_known_cells()
+        start = time.perf_counter()
+        method()
+        elapsed = time.perf_counter() - start
+        # Every pass of the classic engine goes over all rows and columns
+        self.trace.add(PassRecord(self.iteration, method.__name__.lstrip('_'), elapsed, self.count_known_cells() - known, self.width + self.height))
+
+    def _solve_classic(self) -> None:
+        self._init_solve()
+        self._run_pass(self._calc_mostness)
         known = self.count_known_cells()
         counter = 3
         while True:
-            self._update_sizes()
-            self._calc_possible_hints()
-            self._deduce_mostness()
-            self._calc_mostness()
-            self._apply_mostness_overlap()
-            self._find_finished_cells()
+            self.iteration += 1
+            self._run_pass(self._update_sizes)
+            self._run_pass(self._calc_possible_hints)
+            self._run_pass(self._deduce_mostness)
+            self._run_pass(self._calc_mostness)
+            self._run_pass(self._apply_mostness_overlap)
+            self._run_pass(self._find_finished_cells)
 
             new_known = self.count_known_cells()
             if new_known == self.width * self.height:
-                print('Solved completely!')
                 break
             if new_known == known:
                 counter -= 1
@@ -252,3 +759,65 @@ class Nonogram:
                 counter = 3
             known = new_known
 
+    def solve(self, engine: str = 'classic', search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0, trace: Union[SolveTrace, None] = None) -> bool:
+        if engine not in ENGINES:
+            raise ValueError('Unknown engine: {}'.format(engine))
+        self.trace = trace
+        self.iteration = 0
+        self.solve_order.clear()
+        self.solve_steps.clear()
+        self.guess_start = None
+        if engine == 'bitmask':
+            self._solve_bitmask()
+        elif engine == 'numpy':
+            self._solve_numpy()
+        else:
+            self._solve_classic()
+        if search and self.count_known_cells() < self.width * self.height:
+            if engine != 'bitmask':
+                self._init_masks()
+                self._propagate(self._all_lines())
+            self._search(max_nodes, time_limit)
+        return self.is_solved()
+
+    def _is_derived(self, x: int, y: int) -> bool:
+        # Cells the user entered and cells that rest on a guess can be different in a valid solution
+        step = self.solve_steps.get((x, y))
+        if step is None or step[1] == 'update':
+            return False
+        return self.guess_start is None or self.solve_order.index((x, y)) < self.guess_start
+
+    def update_cells(self, changes: Iterable[Tuple[int, int, CellState]]) -> None:
+        if len(self.marked_rows) != self.height:
+            self._init_masks()
+        for x, y, state in changes:
+            cell = self.puzzle[y][x].cell
+            cell.initial_state = state
+            current = cell.state
+            if state == current or self.needs_full_solve:
+                # A full solve starts over from the initial states anyway
+                continue
+            if state == CellState.FREE:
+                # Cells derived earlier may depend on the removed mark
+                self.needs_full_solve = True
+            elif current == CellState.FREE:
+                self.current_pass = 'update'
+                self._set_cell_state(x, y, state)
+                self.pending_lines.add((y, False))
+                self.pending_lines.add((x, True))
+            elif self._is_derived(x, y):
+                raise Contradiction('Cell {} {} is {} but has to be {}'.format(x, y, state.name, current.name))
+            else:
+                self.needs_full_solve = True
+
+    def resume(self, search: bool = False, max_nodes: int = 100000, time_limit: float = 10.0) -> bool:
+        if self.needs_full_solve:
+            self.needs_full_solve = False
+            self.pending_lines.clear()
+            return self.solve('bitmask', search, max_nodes, time_limit, self.trace)
+        lines = list(self.pending_lines)
+        self.pending_lines.clear()
+        self._propagate(lines)
+        if search and self.count_known_cells() < self.width * self.height:
+            self._search(max_nodes, time_limit)
+        return self.is_solved()
@@ -0,0 +1,95 @@
+from typing import Iterable, List, Tuple, Dict, Set
+
+
+def _runs(cells: Set[Tuple[int, int]], vertical: bool) -> Tuple[List[List[Tuple[int, int]]], Dict[Tuple[int, int], int]]:
+    runs = []
+    run_of = {}
+    for x, y in sorted(cells, key=lambda cell: (cell[0], cell[1]) if vertical else (cell[1], cell[0])):
+        previous = (x, y - 1) if vertical else (x - 1, y)
+        if previous in run_of:
+            run = run_of[previous]
+        else:
+            run = len(runs)
+            runs.append([])
+        runs[run].append((x, y))
+        run_of[(x, y)] = run
+    return runs, run_of
+
+
+def _max_matching(edges: List[List[int]], right_count: int) -> Tuple[List[int], List[int]]:
+    match_left = [-1] * len(edges)
+    match_right = [-1] * right_count
+    for root in range(len(edges)):
+        # Iterative search for an augmenting path starting at root
+        parent = {}
+        stack = [root]
+        visited = set()
+        end = -1
+        while stack and end < 0:
+            left = stack.pop()
+            for right in edges[left]:
+                if right in visited:
+                    continue
+                visited.add(right)
+                parent[right] = left
+                if match_right[right] < 0:
+                    end = right
+                    break
+                stack.append(match_right[right])
+        while end >= 0:
+            left = parent[end]
+            previous = match_left[left]
+            match_left[left] = end
+            match_right[end] = left
+            end = previous
+    return match_left, match_right
+
+
+def plan_strokes(cells: Iterable[Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+    cells = set(cells)
+    rows, row_of = _runs(cells, False)
+    cols, col_of = _runs(cells, True)
+    edges = [sorted({col_of[cell] for cell in row}) for row in rows]
+    match_row, match_col = _max_matching(edges, len(cols))
+    # König's theorem: alternating paths from unmatched rows give a minimum vertex cover
+    reached_rows = {row for row in range(len(rows)) if match_row[row] < 0}
+    reached_cols = set()
+    stack = list(reached_rows)
+    while stack:
+        row = stack.pop()
+        for col in edges[row]:
+            if col not in reached_cols and match_row[row] != col:
+                reached_cols.add(col)
+                if match_col[col] >= 0 and match_col[col] not in reached_rows:
+                    reached_rows.add(match_col[col])
+                    stack.append(match_col[col])
+    strokes = []
+    covered = set()
+    for row in range(len(rows)):
+        if row not in reached_rows:
+            strokes.append(rows[row][0] + rows[row][-1])
+            covered.update(rows[row])
+    strokes.sort(key=lambda stroke: (stroke[1], stroke[0]))
+    # Vertical strokes come after all horizontal ones, so they may run over covered cells as long as they start on a free one.
+    # A column in a minimum vertex cover always has such a cell, or the cover would still be one without that column.
+    vertical = [_column_stroke(cols[col], covered) for col in sorted(reached_cols)]
+    vertical.sort(key=lambda stroke: (stroke[0], min(stroke[1], stroke[3])))
+    return strokes + vertical
+
+
+def _column_stroke(cells: List[Tuple[int, int]], covered: Set[Tuple[int, int]]) -> Tuple[int, int, int, int]:
+    # A drag sets every cell to the state of its first one, which therefore must not be set already
+    if cells[0] not in covered:
+        return cells[0] + cells[-1]
+    if cells[-1] not in covered:
+        return cells[-1] + cells[0]
+    # Cells above the first free one are all set by horizontal strokes
+    start = next(cell for cell in cells if cell not in covered)
+    return start + cells[-1]
+
+
+def stroke_cells(stroke: Tuple[int, int, int, int]) -> List[Tuple[int, int]]:
+    x1, y1, x2, y2 = stroke
+    dx = (x2 > x1) - (x2 < x1)
+    dy = (y2 > y1) - (y2 < y1)
+    return [(x1 + i * dx, y1 + i * dy) for i in range(max(abs(x2 - x1), abs(y2 - y1)) + 1)]
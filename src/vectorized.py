@@ -0,0 +1,186 @@
+import time
+from typing import List, Tuple, Union, Callable
+
+import numpy as np
+
+from compact import CompactNonogram, FREE, MARKED, BLOCKED, STATES
+from solver import Nonogram, PassRecord
+
+
+def pad_clues(clue_lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    counts = np.array([len(clues) for clues in clue_lists], dtype=np.int32)
+    matrix = np.zeros((len(clue_lists), max(1, int(counts.max(initial=0)))), dtype=np.int32)
+    for i, clues in enumerate(clue_lists):
+        matrix[i, :len(clues)] = clues
+    return matrix, counts
+
+
+def _take(values: np.ndarray, index: np.ndarray) -> np.ndarray:
+    # Same as np.take_along_axis(values, index, axis=1) for contiguous arrays, but a lot faster
+    return np.take(values, index + np.arange(values.shape[0])[:, None] * values.shape[1])
+
+
+def _forward(marked: np.ndarray, blocked: np.ndarray, clues: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # starts[k, l, p] is True if clue k of line l can start at p with all clues before it placed in front of it.
+    # Lines are sorted by their number of clues, so the lines that still have a clue k are always a prefix.
+    lines, size = marked.shape
+    positions = np.arange(size, dtype=np.int32)
+    blocked_before = np.zeros((lines, size + 1), dtype=np.int32)
+    np.cumsum(blocked, axis=1, out=blocked_before[:, 1:])
+    marked_padded = np.zeros((lines, size + 2), dtype=bool)
+    marked_padded[:, 1:-1] = marked
+    # Last marked cell in front of each position
+    last_marked = np.full((lines, size), -1, dtype=np.int32)
+    last_marked[:, 1:] = np.maximum.accumulate(np.where(marked, positions, -1), axis=1)[:, :-1]
+    starts = np.zeros((clues.shape[1], lines, size), dtype=bool)
+    for k in range(clues.shape[1]):
+        n = int(np.count_nonzero(counts > k))
+        value = clues[:n, k, None]
+        end = positions + value
+        inside = end <= size
+        end = np.minimum(end, size)
+        fits = (inside
+                & (_take(blocked_before[:n], end) == blocked_before[:n, :size])
+                & ~marked_padded[:n, :size]
+                & ~_take(marked_padded[:n], end + 1))
+        if k == 0:
+            starts[k, :n] = fits & (last_marked[:n] < 0)
+            continue
+        # Latest end of the previous clue that leaves a gap in front of each position
+        previous = clues[:n, k - 1, None]
+        latest = np.maximum.accumulate(np.where(starts[k - 1, :n], positions, -1), axis=1)
+        before = positions - 1 - previous
+        latest = np.where(before >= 0, _take(latest, np.maximum(before, 0)), -1)
+        latest_end = np.where(latest >= 0, latest + previous, -1)
+        starts[k, :n] = fits & (latest_end >= 0) & (last_marked[:n] < latest_end)
+    return starts
+
+
+def solve_lines(lines: np.ndarray, clues: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    order = np.argsort(-counts, kind='stable')
+    lines = lines[order]
+    clues = np.ascontiguousarray(clues[order])
+    counts = counts[order]
+    count, size = lines.shape
+    positions = np.arange(size, dtype=np.int32)
+    marked = lines == MARKED
+    blocked = lines == BLOCKED
+    forward = _forward(marked, blocked, clues, counts)
+    # The backward pass is a forward pass over the reversed lines and clues
+    reverse = counts[:, None] - 1 - np.arange(clues.shape[1])
+    reversed_clues = np.where(reverse >= 0, _take(clues, np.maximum(reverse, 0)), 0)
+    backward = _forward(np.ascontiguousarray(marked[:, ::-1]), np.ascontiguousarray(blocked[:, ::-1]), reversed_clues, counts).ravel()
+    must_mark = np.zeros((count, size), dtype=bool)
+    covered = np.zeros((count, size), dtype=bool)
+    leftmost = np.zeros(clues.shape, dtype=np.int32)
+    rightmost = np.zeros(clues.shape, dtype=np.int32)
+    ok = counts > 0
+    for k in range(clues.shape[1]):
+        n = int(np.count_nonzero(counts > k))
+        value = clues[:n, k, None]
+        reversed_start = size - positions - value
+        # Position of the same placement in the backward pass
+        flat = ((counts[:n, None] - 1 - k) * count + np.arange(n)[:, None]) * size + np.maximum(reversed_start, 0)
+        possible = forward[k, :n] & (reversed_start >= 0) & np.take(backward, flat)
+        if k == 0:
+            ok[:n] &= possible.any(axis=1)
+        leftmost[:n, k] = possible.argmax(axis=1)
+        rightmost[:n, k] = size - 1 - possible[:, ::-1].argmax(axis=1)
+        must_mark[:n] |= (positions >= rightmost[:n, k, None]) & (positions < leftmost[:n, k, None] + value)
+        started = np.zeros((n, size + 1), dtype=np.int32)
+        np.cumsum(possible, axis=1, out=started[:, 1:])
+        covered[:n] |= started[:, 1:] > _take(started, np.maximum(positions + 1 - value, 0))
+    # Lines without clues are fine as long as nothing is marked
+    ok |= (counts == 0) & ~marked.any(axis=1)
+    free = (lines == FREE) & ok[:, None]
+    lines[free & ~covered] = BLOCKED
+    lines[free & must_mark] = MARKED
+    result = np.empty_like(lines)
+    result[order] = lines
+    line_ok = np.empty_like(ok)
+    line_ok[order] = ok
+    bounds = np.empty((2,) + clues.shape, dtype=np.int32)
+    bounds[0, order] = leftmost
+    bounds[1, order] = rightmost
+    return result, line_ok, bounds[0], bounds[1]
+
+
+def solve_boards(states: np.ndarray, row_clues: np.ndarray, row_counts: np.ndarray, col_clues: np.ndarray, col_counts: np.ndarray,
+                 on_pass: Union[Callable[[bool, np.ndarray, np.ndarray, np.ndarray, np.ndarray, float], None], None] = None) -> np.ndarray:
+    boards, height, width = states.shape
+    ok = np.ones(boards, dtype=bool)
+    # Only lines with new cells since they were last solved are solved again
+    dirty = {False: np.ones((boards, height), dtype=bool), True: np.ones((boards, width), dtype=bool)}
+    flipped = False
+    while ok.any() and (dirty[False].any() or dirty[True].any()):
+        start = time.perf_counter()
+        view = states.transpose(0, 2, 1) if flipped else states
+        clues, counts = (col_clues, col_counts) if flipped else (row_clues, row_counts)
+        lines = view.reshape(-1, view.shape[2])
+        selected = np.flatnonzero(dirty[flipped] & ok[:, None])
+        dirty[flipped][:] = False
+        changed = np.zeros(view.shape, dtype=bool)
+        # Clue positions of the lines solved in this pass, the same as Hint.leftmost and Hint.rightmost
+        leftmost = np.zeros(clues.shape, dtype=np.int32)
+        rightmost = np.zeros(clues.shape, dtype=np.int32)
+        if selected.size:
+            solved, line_ok, left, right = solve_lines(lines[selected], clues.reshape(-1, clues.shape[2])[selected], counts.reshape(-1)[selected])
+            leftmost.reshape(-1, clues.shape[2])[selected] = left
+            rightmost.reshape(-1, clues.shape[2])[selected] = right
+            failed = np.zeros(lines.shape[0], dtype=bool)
+            failed[selected[~line_ok]] = True
+            ok &= ~failed.reshape(boards, -1).any(axis=1)
+            new = lines.copy()
+            new[selected] = solved
+            new = new.reshape(view.shape)
+            changed = (new != view) & ok[:, None, None]
+            view[changed] = new[changed]
+            dirty[not flipped] |= changed.any(axis=1)
+        if on_pass is not None:
+            solved_lines = np.zeros(lines.shape[0], dtype=bool)
+            solved_lines[selected] = True
+            on_pass(flipped, changed.transpose(0, 2, 1) if flipped else changed, solved_lines.reshape(boards, -1), leftmost, rightmost, time.perf_counter() - start)
+        flipped = not flipped
+    return ok
+
+
+def board_states(puzzle: Nonogram) -> np.ndarray:
+    if isinstance(puzzle, CompactNonogram):
+        return np.frombuffer(puzzle.states, dtype=np.int8).reshape(puzzle.height, puzzle.width)
+    return np.array([[cell.cell.state.value for cell in row] for row in puzzle.puzzle], dtype=np.int8).reshape(puzzle.height, puzzle.width)
+
+
+def solve_puzzles(puzzles: List[Nonogram]) -> List[bool]:
+    height = max(puzzle.height for puzzle in puzzles)
+    width = max(puzzle.width for puzzle in puzzles)
+    # Smaller boards are padded with blocked cells, which lines without clues accept
+    states = np.full((len(puzzles), height, width), BLOCKED, dtype=np.int8)
+    rows = []
+    columns = []
+    for i, puzzle in enumerate(puzzles):
+        puzzle._init_solve()
+        puzzle._init_masks()
+        states[i, :puzzle.height, :puzzle.width] = board_states(puzzle)
+        rows += [[hint.value for hint in row] for row in puzzle.horizontal] + [[]] * (height - puzzle.height)
+        columns += [[hint.value for hint in column] for column in puzzle.vertical] + [[]] * (width - puzzle.width)
+    row_clues, row_counts = pad_clues(rows)
+    col_clues, col_counts = pad_clues(columns)
+
+    def apply_pass(flipped: bool, changed: np.ndarray, solved: np.ndarray, leftmost: np.ndarray, rightmost: np.ndarray, elapsed: float) -> None:
+        for i, puzzle in enumerate(puzzles):
+            puzzle.current_pass = 'columns' if flipped else 'rows'
+            hint_lists = puzzle.vertical if flipped else puzzle.horizontal
+            for j in np.flatnonzero(solved[i, :len(hint_lists)]).tolist():
+                for hint, left, right in zip(hint_lists[j], leftmost[i, j].tolist(), rightmost[i, j].tolist()):
+                    hint.leftmost = left
+                    hint.rightmost = right
+            ys, xs = np.nonzero(changed[i])
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                puzzle._set_cell_state(x, y, STATES[int(states[i, y, x])])
+            if puzzle.trace is not None:
+                puzzle.trace.add(PassRecord(puzzle.iteration, puzzle.current_pass, elapsed, len(xs), puzzle.width if flipped else puzzle.height))
+            puzzle.iteration += 1
+
+    ok = solve_boards(states, row_clues.reshape(len(puzzles), height, -1), row_counts.reshape(len(puzzles), height),
+                      col_clues.reshape(len(puzzles), width, -1), col_counts.reshape(len(puzzles), width), apply_pass)
+    return ok.tolist()
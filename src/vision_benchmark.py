@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Union
+
+import number_detection
+from capture import ArrayCapture, image_to_array
+from generator import generate_puzzle
+from puzzlefile import puzzle_from_dict
+from puzzlemanager import PuzzleManager
+from render import render_puzzle, CELL_SIZE
+from solver import CellState
+
+
+def read_rendered(data: Dict[str, Any], cell_size: int, scale: float, workers: int, save: Union[str, None], name: str) -> Dict[str, Any]:
+    empty = render_puzzle(puzzle_from_dict({'rows': data['rows'], 'columns': data['columns']}), cell_size, scale)
+    solved = render_puzzle(puzzle_from_dict({'rows': data['rows'], 'columns': data['columns'], 'grid': data['solution']}), cell_size, scale)
+    if save:
+        empty.save(os.path.join(save, '{}.png'.format(name)))
+        solved.save(os.path.join(save, '{}-solved.png'.format(name)))
+    manager = PuzzleManager(name, ArrayCapture(image_to_array(empty)))
+    manager.read_puzzle(workers)
+    times = dict(manager.read_times)
+    puzzle = manager.puzzle
+    result = {'times': times, 'geometry': puzzle.width == len(data['columns']) and puzzle.height == len(data['rows'])}
+    if not result['geometry']:
+        return result
+    lines = [[hint.value for hint in row] for row in puzzle.horizontal] + [[hint.value for hint in column] for column in puzzle.vertical]
+    expected = data['rows'] + data['columns']
+    result['lines'] = len(expected)
+    result['lines_correct'] = sum(1 for read, clues in zip(lines, expected) if read == clues)
+    result['numbers'] = sum(len(clues) for clues in expected)
+    result['numbers_correct'] = sum(1 for read, clues in zip(lines, expected) if len(read) == len(clues) for a, b in zip(read, clues) if a == b)
+    # Cell states are read from the solved board, with the geometry of the empty one
+    pixels = image_to_array(solved)
+    start = time.perf_counter()
+    states = manager.read_cell_states_array(pixels[manager.puzzle_box[1]:manager.puzzle_box[3], manager.puzzle_box[0]:manager.puzzle_box[2]])
+    times['cell_states'] = time.perf_counter() - start
+    result['cells'] = puzzle.width * puzzle.height
+    result['cells_correct'] = sum(1 for row, line in zip(states, data['solution']) for state, char in zip(row, line) if (state == CellState.MARKED) == (char == '#'))
+    return result
+
+
+def run_benchmark(sizes: List[int], scales: List[float], cell_size: int, density: float, count: int, seed: int, workers: int, save: Union[str, None]) -> List[Dict[str, Any]]:
+    results = []
+    for size in sizes:
+        rng = random.Random('{}-{}'.format(seed, size))
+        puzzles = [generate_puzzle(size, size, density, rng) for _ in range(count)]
+        for scale in scales:
+            times = {}
+            totals = {'geometry': 0, 'lines': 0, 'lines_correct': 0, 'numbers': 0, 'numbers_correct': 0, 'cells': 0, 'cells_correct': 0}
+            for i, data in enumerate(puzzles):
+                result = read_rendered(data, cell_size, scale, workers, save, '{}x{}-{}-{}'.format(size, size, scale, i))
+                for name, elapsed in result.pop('times').items():
+                    times[name] = times.get(name, 0.0) + elapsed
+                for key, value in result.items():
+                    totals[key] += value
+            results.append({
+                'size': size,
+                'scale': scale,
+                'puzzles': count,
+                'ms_per_stage': {name: elapsed * 1000 / count for name, elapsed in times.items()},
+                'geometry_rate': totals['geometry'] / count,
+                'line_accuracy': totals['lines_correct'] / totals['lines'] if totals['lines'] else 0.0,
+                'number_accuracy': totals['numbers_correct'] / totals['numbers'] if totals['numbers'] else 0.0,
+                'cell_accuracy': totals['cells_correct'] / totals['cells'] if totals['cells'] else 0.0,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading rendered Nonogram screenshots')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 15, 20], help='side lengths of the generated puzzles')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 1.5, 2.0], help='zoom factors to render the boards at')
+    parser.add_argument('--cell-size', type=int, default=CELL_SIZE, help='size of a cell in pixels at scale 1')
+    parser.add_argument('--density', type=float, default=0.55, help='probability that a cell is marked')
+    parser.add_argument('--count', type=int, default=3, help='number of puzzles per size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', '-w', type=int, default=1, help='number of processes used to read the hints')
+    parser.add_argument('--glyphs', help='glyph cache to use (default: a new, empty one)')
+    parser.add_argument('--save', metavar='DIR', help='directory to save the rendered boards to')
+    parser.add_argument('--output', '-o', default='-', help='file to write the JSON results to (default: stdout)')
+    args = parser.parse_args()
+    # Never stop to ask for corrections, a wrong number counts against the accuracy instead
+    number_detection.ask_for_fixes = False
+    with tempfile.TemporaryDirectory() as directory:
+        number_detection.glyph_cache = number_detection.GlyphCache(args.glyphs or os.path.join(directory, 'glyphs.jsonl'))
+        number_detection.corrections = number_detection.CorrectionStore(os.path.join(directory, 'corrections.jsonl'))
+        results = {
+            'config': {'sizes': args.sizes, 'scales': args.scales, 'cell_size': args.cell_size, 'density': args.density, 'count': args.count, 'seed': args.seed},
+            'results': run_benchmark(args.sizes, args.scales, args.cell_size, args.density, args.count, args.seed, args.workers, args.save),
+        }
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+from batch import solve_many
+from puzzlefile import read_puzzles
+
+RECORDS = [
+    {'id': 'valid', 'rows': [[1]], 'columns': [[1]]},
+    {'id': 'character', 'rows': [[1]], 'columns': [[1]], 'grid': ['?']},
+    {'id': 'size', 'rows': [[1]], 'columns': [[1]], 'grid': ['##']},
+    {'id': 'clues', 'columns': [[1]]},
+    {'id': 'contradiction', 'rows': [[3], [1]], 'columns': [[1], [1], [1]]},
+]
+
+
+@pytest.mark.parametrize('engine', ['classic', 'bitmask', 'numpy'])
+def test_bad_records_do_not_stop_the_batch(engine):
+    records = {record['id']: record for record in solve_many(RECORDS, 1, engine)}
+    assert sorted(records) == sorted(record['id'] for record in RECORDS)
+    assert records['valid']['solved']
+    for name in ('character', 'size', 'clues', 'contradiction'):
+        assert not records[name]['solved']
+    for name in ('character', 'size', 'clues'):
+        assert records[name]['error']
+
+
+@pytest.mark.parametrize('engine', ['classic', 'numpy'])
+def test_unreadable_lines_do_not_stop_the_batch(engine):
+    lines = io.StringIO('{"id": "a", "rows": [[1]], "columns": [[1]]}\nnot json\n{"id": "c", "rows": [[2]], "columns": [[1], [1]]}\n')
+    records = list(solve_many(read_puzzles(lines), 1, engine))
+    assert [record['solved'] for record in records] == [True, False, True]
+    assert 'Line 2' in records[1]['error']
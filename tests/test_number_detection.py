@@ -0,0 +1,75 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from number_detection import GlyphCache, CorrectionStore, crop_content_array
+from render import load_font
+
+
+def glyph(value, cell, font_size):
+    image = Image.new('RGB', (cell * 2, cell), (255, 255, 255))
+    ImageDraw.Draw(image).text((cell, cell // 2), str(value), fill=(0, 0, 0), font=load_font(font_size), anchor='mm')
+    return crop_content_array(np.asarray(image))
+
+
+def test_glyph_cache_exact_hit(tmp_path):
+    cache = GlyphCache(str(tmp_path / 'glyphs.jsonl'))
+    cache.learn(glyph(17, 20, 11), 17)
+    assert GlyphCache(cache.path).lookup(glyph(17, 20, 11)) == 17
+
+
+def test_glyph_cache_other_sizes_are_never_wrong(tmp_path):
+    cache = GlyphCache(str(tmp_path / 'glyphs.jsonl'))
+    for value in range(1, 41):
+        cache.learn(glyph(value, 20, 11), value, True)
+    for cell, font_size in [(22, 12), (24, 13), (30, 16), (20, 10), (18, 10), (26, 14)]:
+        for value in range(1, 41):
+            assert cache.lookup(glyph(value, cell, font_size)) in (None, value)
+
+
+def test_glyph_cache_unverified_glyphs_only_match_exactly(tmp_path):
+    cache = GlyphCache(str(tmp_path / 'glyphs.jsonl'))
+    cache.learn(glyph(5, 20, 11), 5)
+    assert cache.lookup(glyph(5, 22, 12)) is None
+
+
+def test_glyph_cache_sees_glyphs_of_other_processes(tmp_path):
+    path = str(tmp_path / 'glyphs.jsonl')
+    reader = GlyphCache(path)
+    assert reader.lookup(glyph(3, 20, 11)) is None
+    GlyphCache(path).learn(glyph(3, 20, 11), 3)
+    assert reader.lookup(glyph(3, 20, 11)) == 3
+
+
+def test_glyph_cache_skips_unfinished_lines(tmp_path):
+    path = tmp_path / 'glyphs.jsonl'
+    cache = GlyphCache(str(path))
+    cache.learn(glyph(8, 20, 11), 8)
+    with open(path, 'a') as f:
+        f.write('{"shape": [1')
+    assert GlyphCache(str(path)).lookup(glyph(8, 20, 11)) == 8
+    # The next glyph starts on a line of its own, so both stay readable
+    GlyphCache(str(path)).learn(glyph(9, 20, 11), 9)
+    reader = GlyphCache(str(path))
+    assert reader.lookup(glyph(8, 20, 11)) == 8
+    assert reader.lookup(glyph(9, 20, 11)) == 9
+
+
+def test_correction_store_skips_unfinished_lines(tmp_path):
+    path = tmp_path / 'corrections.jsonl'
+    region = glyph(4, 20, 11)
+    CorrectionStore(str(path)).learn('A', region, 4)
+    with open(path, 'a') as f:
+        f.write('{"text": "x", "ha')
+    CorrectionStore(str(path)).learn('x', region, 4)
+    reader = CorrectionStore(str(path))
+    assert reader.lookup('A', region) == 4
+    assert reader.lookup('x', region) == 4
+
+
+def test_correction_store_does_not_read_its_own_lines_back(tmp_path):
+    path = str(tmp_path / 'corrections.jsonl')
+    store = CorrectionStore(path)
+    store.learn('x', glyph(4, 20, 11), 4)
+    CorrectionStore(path).learn('y', glyph(7, 20, 11), 7)
+    assert store.lookup('y', glyph(7, 20, 11)) == 7
+    assert len(store.corrections['x']) == 1
@@ -0,0 +1,238 @@
+import itertools
+import random
+
+import pytest
+
+from generator import line_clues, generate_unique_puzzle
+from puzzlefile import puzzle_from_dict
+from solver import Nonogram, CellState, Contradiction, LineCache, solve_line, line_cache
+from strokes import plan_strokes, stroke_cells
+
+
+def brute_force_line(clues, size, marked, blocked):
+    solutions = []
+    for cells in itertools.product((False, True), repeat=size):
+        bits = sum(1 << i for i, cell in enumerate(cells) if cell)
+        if bits & blocked or ~bits & marked or line_clues(list(cells)) != clues:
+            continue
+        solutions.append(bits)
+    if not solutions:
+        return None
+    full = (1 << size) - 1
+    always = full
+    never = full
+    for bits in solutions:
+        always &= bits
+        never &= ~bits
+    return always, never
+
+
+def brute_force_count(rows, columns):
+    width = len(columns)
+    count = 0
+    for grid in itertools.product(*[[line for line in itertools.product((False, True), repeat=width) if line_clues(list(line)) == row] for row in rows]):
+        if all(line_clues(list(column)) == clues for column, clues in zip(zip(*grid), columns)):
+            count += 1
+    return count
+
+
+@pytest.mark.parametrize('size', range(1, 9))
+def test_solve_line_matches_brute_force(size):
+    rng = random.Random(size)
+    for _ in range(300):
+        clues = line_clues([rng.random() < 0.5 for _ in range(size)])
+        if rng.random() < 0.2:
+            clues = [rng.randint(1, 4) for _ in range(rng.randint(0, 3))]
+        marked = 0
+        blocked = 0
+        for i in range(size):
+            r = rng.random()
+            if r < 0.15:
+                marked |= 1 << i
+            elif r < 0.3:
+                blocked |= 1 << i
+        expected = brute_force_line(clues, size, marked, blocked)
+        result = solve_line(clues, size, marked, blocked)
+        if expected is None:
+            assert result is None, (clues, size, marked, blocked)
+        else:
+            assert result is not None, (clues, size, marked, blocked)
+            assert result[:2] == expected, (clues, size, marked, blocked)
+
+
+def make_puzzle(rows, columns):
+    puzzle = Nonogram(len(columns), len(rows))
+    for y, row in enumerate(rows):
+        for value in row:
+            puzzle.add_horizontal_hint(y, value)
+    for x, column in enumerate(columns):
+        for value in column:
+            puzzle.add_vertical_hint(x, value)
+    return puzzle
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_count_solutions_matches_brute_force(seed):
+    rng = random.Random(seed)
+    width = rng.randint(2, 4)
+    height = rng.randint(2, 4)
+    grid = [[rng.random() < 0.5 for _ in range(width)] for _ in range(height)]
+    rows = [line_clues(row) for row in grid]
+    columns = [line_clues(list(column)) for column in zip(*grid)]
+    expected = brute_force_count(rows, columns)
+    assert make_puzzle(rows, columns).count_solutions(limit=100) == expected
+
+
+def test_count_solutions_without_solution():
+    assert make_puzzle([[2], [1]], [[1], [1]]).count_solutions() == 0
+
+
+def test_classic_solve_checks_the_clues():
+    # Every cell gets a state, but the columns ask for one mark too many
+    puzzle = make_puzzle([[3], [1]], [[1], [1], [1]])
+    assert not puzzle.solve('classic')
+    assert make_puzzle([[3], [1]], [[2], [1], [1]]).solve('classic')
+
+
+@pytest.mark.parametrize('engine', ['bitmask', 'numpy'])
+@pytest.mark.parametrize('seed', range(10))
+def test_hint_bounds_match_the_final_grid(engine, seed):
+    rng = random.Random(seed)
+    grid = [[rng.random() < 0.6 for _ in range(12)] for _ in range(10)]
+    puzzle = make_puzzle([line_clues(row) for row in grid], [line_clues(list(column)) for column in zip(*grid)])
+    puzzle.solve(engine)
+    puzzle._init_masks()
+    lines = [(hints, puzzle.width, puzzle.marked_rows[y], puzzle.blocked_rows[y]) for y, hints in enumerate(puzzle.horizontal)]
+    lines += [(hints, puzzle.height, puzzle.marked_cols[x], puzzle.blocked_cols[x]) for x, hints in enumerate(puzzle.vertical)]
+    for hints, size, marked, blocked in lines:
+        _, _, leftmost, rightmost = solve_line([hint.value for hint in hints], size, marked, blocked)
+        assert [(hint.leftmost, hint.rightmost) for hint in hints] == list(zip(leftmost, rightmost))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_bitmask_steps_are_single_lines(seed):
+    rng = random.Random(seed)
+    grid = [[rng.random() < 0.6 for _ in range(12)] for _ in range(10)]
+    puzzle = make_puzzle([line_clues(row) for row in grid], [line_clues(list(column)) for column in zip(*grid)])
+    puzzle.solve('bitmask')
+    groups = puzzle.solve_groups()
+    assert len(groups) > 1
+    for group in groups:
+        assert len({x for x, _ in group}) == 1 or len({y for _, y in group}) == 1
+
+
+def test_line_cache_evicts_the_least_recently_used_line():
+    cache = LineCache(maxsize=2)
+    assert cache.solve_line((1,), 3, 0, 0) == solve_line([1], 3, 0, 0)
+    cache.solve_line((2,), 3, 0, 0)
+    assert cache.solve_line((1,), 3, 0, 0) == solve_line([1], 3, 0, 0)
+    cache.solve_line((3,), 3, 0, 0)
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'size': 2, 'maxsize': 2}
+    # (2,) was used least recently, so it was dropped and (1,) was kept
+    cache.solve_line((1,), 3, 0, 0)
+    cache.solve_line((2,), 3, 0, 0)
+    assert cache.stats() == {'hits': 2, 'misses': 4, 'size': 2, 'maxsize': 2}
+
+
+def test_line_cache_is_only_used_while_searching():
+    line_cache.clear()
+    puzzle = make_puzzle([[1], [1]], [[1], [1]])
+    assert not puzzle.solve('bitmask')
+    assert line_cache.stats()['misses'] == 0
+    assert puzzle.solve('bitmask', search=True)
+    assert line_cache.stats()['misses'] > 0
+    assert puzzle.line_cache is None
+
+
+def test_update_cells_resumes_with_correct_marks():
+    puzzle = make_puzzle([[1], [1]], [[1], [1]])
+    assert not puzzle.solve('bitmask')
+    puzzle.update_cells([(0, 0, CellState.MARKED)])
+    assert puzzle.resume()
+    assert puzzle.puzzle[1][1].cell.state == CellState.MARKED
+
+
+def test_update_cells_rejects_wrong_marks():
+    puzzle = make_puzzle([[2], []], [[1], [1]])
+    assert puzzle.solve('bitmask')
+    with pytest.raises(Contradiction):
+        puzzle.update_cells([(0, 1, CellState.MARKED)])
+
+
+def test_update_cells_accepts_the_other_solution_of_a_guess():
+    puzzle = make_puzzle([[1], [1]], [[1], [1]])
+    assert puzzle.solve('bitmask', search=True)
+    x = 0 if puzzle.puzzle[0][0].cell.state == CellState.BLOCKED else 1
+    puzzle.update_cells([(x, 0, CellState.MARKED)])
+    assert puzzle.needs_full_solve
+    assert puzzle.resume()
+    assert puzzle.puzzle[0][x].cell.state == CellState.MARKED
+
+
+def test_update_cells_solves_again_without_a_removed_mark():
+    puzzle = make_puzzle([[1], [1]], [[1], [1]])
+    puzzle.solve('bitmask')
+    puzzle.update_cells([(0, 0, CellState.MARKED)])
+    assert puzzle.resume()
+    puzzle.update_cells([(0, 0, CellState.FREE)])
+    assert puzzle.needs_full_solve
+    assert not puzzle.resume()
+    assert puzzle.count_known_cells() == 0
+    # Changing an own mark is not a mistake either
+    puzzle.update_cells([(0, 0, CellState.MARKED)])
+    puzzle.resume()
+    puzzle.update_cells([(0, 0, CellState.BLOCKED)])
+    assert puzzle.resume()
+    assert puzzle.puzzle[0][1].cell.state == CellState.MARKED
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_generate_unique_puzzle(seed):
+    data = generate_unique_puzzle(8, 8, 0.5, random.Random(seed))
+    assert puzzle_from_dict(data).count_solutions() == 1
+
+
+def max_matching_size(cells):
+    # Rows and columns of runs as in plan_strokes, matched with a plain augmenting path search
+    def run_start(cell, dx, dy):
+        x, y = cell
+        while (x - dx, y - dy) in cells:
+            x, y = x - dx, y - dy
+        return x, y
+
+    edges = {}
+    for cell in cells:
+        edges.setdefault(run_start(cell, 1, 0), []).append(run_start(cell, 0, 1))
+    match = {}
+
+    def augment(row, seen):
+        for col in edges[row]:
+            if col not in seen:
+                seen.add(col)
+                if col not in match or augment(match[col], seen):
+                    match[col] = row
+                    return True
+        return False
+
+    return sum(augment(row, set()) for row in edges)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_plan_strokes_covers_every_cell(seed):
+    rng = random.Random(seed)
+    cells = {(x, y) for x in range(8) for y in range(8) if rng.random() < 0.5}
+    strokes = plan_strokes(cells)
+    # A drag toggles its first cell and gives every other cell on the way the same state
+    marked = set()
+    for stroke in strokes:
+        assert stroke[0] == stroke[2] or stroke[1] == stroke[3]
+        path = stroke_cells(stroke)
+        assert set(path) <= cells
+        assert path[0] not in marked
+        marked.update(path)
+    assert marked == cells
+    assert len(strokes) == max_matching_size(cells)
+
+
+def test_plan_strokes_plus_shape():
+    assert len(plan_strokes({(1, 0), (0, 1), (1, 1), (2, 1), (1, 2)})) == 2